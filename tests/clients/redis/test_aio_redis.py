@@ -0,0 +1,19 @@
+import asyncio
+from unittest import TestCase
+from wbximy_common.clients.redis._aio_redis import AioRedis
+
+
+class TestAioRedisShared(TestCase):
+
+    def test_per_loop(self):
+        async def get_shared():
+            client = AioRedis.get_shared(host='shared.test')
+            self.assertIs(AioRedis.get_shared(host='shared.test'), client)
+            return client
+
+        # 前一个loop关闭后，即使新loop复用了同一个id，也不会拿到绑定在旧loop上的client
+        first = asyncio.run(get_shared())
+        second = asyncio.run(get_shared())
+        self.assertIsNot(first, second)
+        keys = [k for k in AioRedis._shared_cache if k[0] == 'shared.test']
+        self.assertEqual(len(keys), 1)
@@ -0,0 +1,20 @@
+import uuid
+from unittest import TestCase, skipUnless
+from wbximy_common.clients.redis.redis_bloom import RedisBloomFilter
+from tests.clients.redis.test_redis_stream_queue import _redis_available
+
+
+@skipUnless(_redis_available(), 'redis-server not available on localhost:6379')
+class TestRedisBloomFilter(TestCase):
+
+    def test_1(self):
+        bloom = RedisBloomFilter(f'test_bloom_{uuid.uuid4().hex[:8]}', capacity=1000, error_rate=0.01, host='localhost')
+        self.assertEqual((bloom.num_bits, bloom.num_hashes), (9586, 7))
+        try:
+            values = [f'v{i}' for i in range(1000)]
+            self.assertEqual(bloom.add_many(values + ['v0']).count(True), 1000)
+            self.assertTrue(all(bloom.contains_many(values)))
+            false_positives = sum(bloom.contains_many([f'x{i}' for i in range(1000)]))
+            self.assertLess(false_positives, 30)
+        finally:
+            bloom.clear()
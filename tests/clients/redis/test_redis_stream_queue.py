@@ -0,0 +1,40 @@
+import time
+import uuid
+from unittest import TestCase, skipUnless
+import redis
+from wbximy_common.clients.redis.redis_stream_queue import RedisStreamQueue
+
+
+def _redis_available() -> bool:
+    try:
+        return redis.Redis(host='localhost', port=6379, socket_connect_timeout=0.5).ping()
+    except redis.RedisError:
+        return False
+
+
+@skipUnless(_redis_available(), 'redis-server not available on localhost:6379')
+class TestRedisStreamQueue(TestCase):
+
+    def setUp(self):
+        self.name = f'test_stream_queue_{uuid.uuid4().hex[:8]}'
+
+    def tearDown(self):
+        redis.Redis(host='localhost', port=6379).delete(self.name, f'{self.name}:rt')
+
+    def test_1(self):
+        q0 = RedisStreamQueue(self.name, consumer='c0', visibility_timeout=0.2, host='localhost')
+        q1 = RedisStreamQueue(self.name, consumer='c1', visibility_timeout=0.2, host='localhost')
+        q0.push_many(['a', 'b', 'c'])
+        q0.push('rt', realtime=True)
+        messages = q0.read(count=2)
+        self.assertEqual([m.value for m in messages], ['rt', 'a'])
+        self.assertEqual([m.value for m in q1.read(count=10)], ['b', 'c'])
+        self.assertEqual(q0.pending(), 4)
+
+        # c0 未ack，超时后由c1领取
+        time.sleep(0.3)
+        messages = q1.read(count=10)
+        self.assertEqual(sorted(m.value for m in messages), ['a', 'b', 'c', 'rt'])
+        self.assertEqual(q1.ack(messages), 4)
+        self.assertEqual(q1.pending(), 0)
+        self.assertEqual(q1.read(count=10, wait=0.1), [])
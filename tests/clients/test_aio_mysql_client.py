@@ -0,0 +1,157 @@
+import asyncio
+from typing import Callable, List, Tuple
+from unittest import IsolatedAsyncioTestCase, TestCase, mock
+from wbximy_common.clients import aio_mysql_client
+from wbximy_common.clients.aio_mysql_client import AioMySQLClient
+
+# handle(sql, args) -> (rows, rowcount, lastrowid)
+HandlerType = Callable[[str, object], Tuple[List[dict], int, int]]
+
+
+class FakeCursor:
+    def __init__(self, handler: HandlerType):
+        self.handler = handler
+        self.rows: List[dict] = []
+        self.lastrowid = 0
+
+    async def execute(self, sql, args=None):
+        self.rows, rowcount, self.lastrowid = self.handler(sql, args)
+        return rowcount
+
+    async def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    async def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    async def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    async def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, handler: HandlerType):
+        self.handler = handler
+
+    async def cursor(self, cursor_class=None):
+        return FakeCursor(self.handler)
+
+    async def begin(self):
+        pass
+
+    async def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# 代替aiomysql连接池，记录创建时所在的event loop
+class FakePool:
+    def __init__(self, handler: HandlerType):
+        self.handler = handler
+        self.loop = asyncio.get_running_loop()
+        self.closed = False
+        self.acquired = 0
+
+    async def acquire(self):
+        self.acquired += 1
+        return FakeConnection(self.handler)
+
+    def release(self, conn):
+        self.acquired -= 1
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+
+# patch aiomysql.create_pool，创建的连接池记录在pools中，SQL由handle处理；测试结束后恢复共享连接池的缓存
+class FakePoolMixin:
+
+    def handle(self, sql, args) -> Tuple[List[dict], int, int]:
+        return [], 0, 0
+
+    def setUp(self):
+        self.pools: List[FakePool] = []
+
+        async def create_pool(**kwargs):
+            pool = FakePool(self.handle)
+            self.pools.append(pool)
+            return pool
+
+        cache = mock.patch.dict(AioMySQLClient._conn_pool_cache, clear=True)
+        locks = mock.patch.dict(AioMySQLClient._conn_pool_cache_locks, clear=True)
+        create = mock.patch.object(aio_mysql_client.aiomysql, 'create_pool', create_pool)
+        for patcher in (cache, locks, create):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class TestAioMySQLClientPool(FakePoolMixin, TestCase):
+
+    def test_shared_per_loop(self):
+        async def run():
+            c1 = AioMySQLClient(host='db.test', user='u', password='p', tunnel=False)
+            c2 = AioMySQLClient(host='db.test', user='u', password='p', tunnel=False)
+            return await c1._init_conn_pool(), await c2._init_conn_pool(), await c1._init_conn_pool()
+
+        p1, p2, p3 = asyncio.run(run())
+        self.assertIs(p1, p2)
+        self.assertIs(p1, p3)
+        self.assertEqual(len(self.pools), 1)
+
+    # 旧loop关闭后，同一个client在新loop中重新创建连接池，旧loop的缓存被清理
+    def test_new_loop(self):
+        client = AioMySQLClient(host='db.test', user='u', password='p', tunnel=False)
+        first = asyncio.run(client._init_conn_pool())
+        second = asyncio.run(client._init_conn_pool())
+        self.assertIsNot(first, second)
+        self.assertIs(second.loop, client._conn_pool_loop)
+        self.assertEqual([loop for _, loop in AioMySQLClient._conn_pool_cache], [second.loop])
+        self.assertEqual(list(AioMySQLClient._conn_pool_cache_locks), [second.loop])
+
+
+class TestAioMySQLClient(FakePoolMixin, IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.executed = []
+
+    def handle(self, sql, args):
+        self.executed.append(sql)
+        if sql.startswith('select'):
+            return [{'id': 1}, {'id': 2}, {'id': 3}], 3, 0
+        return [], 2, 7
+
+    async def test_1(self):
+        client = AioMySQLClient(host='db.test', user='u', password='p', tunnel=False, max_write_per_second=1000)
+        self.assertEqual(await client.select('select * from tb'), {'id': 1})
+        self.assertEqual([d async for d in client.select_many('select * from tb')], [{'id': 1}, {'id': 2}, {'id': 3}])
+        self.assertEqual([d async for d in client.select_many('select * from tb', stream=True, fetch_size=2)],
+                         [{'id': 1}, {'id': 2}, {'id': 3}])
+        self.assertEqual(await client.execute('update tb set a=1'), 2)
+        self.assertEqual(await client.insert('insert into tb set a=1'), 7)
+        self.assertEqual(self.executed[:2], ['select * from tb limit 1', 'select * from tb limit 40000'])
+        self.assertEqual(self.pools[0].acquired, 0)
+
+    # 写入前先获取1个令牌，超出的行数在写入后补扣
+    async def test_write_limiter(self):
+        executed = self.executed
+
+        class Limiter:
+            def reserve(self, n):
+                executed.append(f'reserve {n}')
+                return 0.0
+
+        client = AioMySQLClient(host='db.test', user='u', password='p', tunnel=False, write_limiter=Limiter())
+        self.assertEqual(await client.execute('update tb set a=1'), 2)
+        self.assertEqual(await client.insert('insert into tb set a=1'), 7)
+        self.assertEqual(executed, ['reserve 1', 'update tb set a=1', 'reserve 1',
+                                    'reserve 1', 'insert into tb set a=1'])
@@ -0,0 +1,194 @@
+from typing import List
+from unittest import TestCase, mock, skipIf
+
+try:
+    from wbximy_common.clients import kafka_client
+    from kafka.errors import KafkaError, CommitFailedError
+    from kafka.structs import TopicPartition
+except (ImportError, SyntaxError):  # kafka==1.3.5 在python3.7+上import失败(async关键字)
+    kafka_client = None
+
+
+class FakeFuture:
+    def __init__(self):
+        self.callbacks, self.errbacks = [], []
+        self.is_done, self.exception = False, None
+
+    def add_callback(self, f, *args):
+        self.callbacks.append((f, args))
+
+    def add_errback(self, f, *args):
+        self.errbacks.append((f, args))
+
+    def succeeded(self) -> bool:
+        return self.is_done and self.exception is None
+
+    def success(self, value):
+        self.is_done = True
+        for f, args in self.callbacks:
+            f(*args, value)
+
+    def failure(self, e: Exception):
+        self.is_done, self.exception = True, e
+        for f, args in self.errbacks:
+            f(*args, e)
+
+
+# 代替KafkaProducer：send放入缓冲区，flush时完成，值以bad开头的消息写入失败，值为raise时send直接抛出异常
+class FakeProducer:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.pending = []
+        self.sent = []
+        self.closed = False
+
+    def send(self, topic, key=None, value=None):
+        if value == b'raise':
+            raise KafkaError('buffer full')
+        future = FakeFuture()
+        self.pending.append((value, future))
+        self.sent.append((topic, key, value))
+        return future
+
+    def flush(self, timeout=None):
+        pending, self.pending = self.pending, []
+        for i, (value, future) in enumerate(pending):
+            if value.startswith(b'bad'):
+                future.failure(KafkaError('not leader'))
+            else:
+                future.success(('topic', 0, i))
+
+    def close(self):
+        self.closed = True
+
+
+# 代替KafkaConsumer：poll依次返回batches，取完后调用on_empty(如stop)；commit/seek记录在events中
+class FakeConsumer:
+    def __init__(self, *topics, **kwargs):
+        self.kwargs = kwargs
+        self.batches = []
+        self.events = []
+        self.commit_errors = 0  # 前n次commit抛出CommitFailedError
+        self.on_empty = None
+
+    def poll(self, timeout_ms=0, max_records=None):
+        if not self.batches:
+            self.on_empty()
+            return {}
+        return self.batches.pop(0)
+
+    def commit(self, offsets=None):
+        self.events.append(('commit', {tp.partition: o.offset for tp, o in offsets.items()}))
+        if self.commit_errors > 0:
+            self.commit_errors -= 1
+            raise CommitFailedError('rebalanced')
+
+    def seek(self, tp, offset):
+        self.events.append(('seek', tp.partition, offset))
+
+    def close(self):
+        pass
+
+
+def _records(partition: int, offsets: range) -> dict:
+    fields = dict.fromkeys(kafka_client.ConsumerRecord._fields)
+    tp = TopicPartition('topic', partition)
+    return {tp: [kafka_client.ConsumerRecord(**fields | {'topic': 'topic', 'partition': partition, 'offset': offset,
+                                                          'value': f'v{offset}'.encode('utf8')})
+                 for offset in offsets]}
+
+
+@skipIf(kafka_client is None, 'kafka is not importable')
+class TestKafkaProducerClient(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(kafka_client, 'KafkaProducer', FakeProducer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.successes: List[str] = []
+        self.errors: List[str] = []
+
+    def _client(self, **kwargs):
+        return kafka_client.KafkaProducerClient(
+            'localhost:9092', 'topic',
+            on_success=lambda message, metadata: self.successes.append(message),
+            on_error=lambda message, e: self.errors.append(message),
+            **kwargs,
+        )
+
+    def test_sync(self):
+        client = self._client()
+        self.assertTrue(client.write('a', key='k'))
+        self.assertFalse(client.write('bad'))
+        self.assertEqual(client.producer.sent, [('topic', b'k', b'a'), ('topic', None, b'bad')])
+        self.assertEqual((self.successes, self.errors), (['a'], ['bad']))
+        self.assertEqual((client.success_count, client.error_count), (1, 1))
+        self.assertEqual(client.write_many(['b', 'bad2', 'c']), 2)
+
+    # 放入缓冲区即返回，回调在发送完成(flush)时执行
+    def test_async(self):
+        client = self._client(async_mode=True, linger_ms=20)
+        self.assertEqual(client.producer.kwargs['linger_ms'], 20)
+        self.assertEqual(client.write_many(['a', 'bad', 'c'], keys=['k1', None, 'k3']), 3)
+        self.assertTrue(client.write('d'))
+        self.assertEqual((self.successes, self.errors), ([], []))
+        client.close()
+        self.assertTrue(client.producer.closed)
+        self.assertEqual((self.successes, self.errors), (['a', 'c', 'd'], ['bad']))
+        self.assertEqual([key for _, key, _ in client.producer.sent], [b'k1', None, b'k3', None])
+
+    # send失败时释放占用的in flight名额，否则max_in_flight=1时第二次写入会一直阻塞
+    def test_send_error(self):
+        client = self._client(async_mode=True, max_in_flight=1)
+        self.assertFalse(client.write('raise'))
+        self.assertEqual(client.write_many(['raise', 'a']), 1)
+        client.flush()
+        self.assertTrue(client.write('b'))
+        client.flush()
+        self.assertEqual((self.successes, self.errors), (['a', 'b'], []))
+
+
+@skipIf(kafka_client is None, 'kafka is not importable')
+class TestKafkaConsumerClient(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(kafka_client, 'KafkaConsumer', FakeConsumer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = kafka_client.KafkaConsumerClient('localhost:9092', 'topic', auto_commit=False)
+        self.consumer: FakeConsumer = self.client.consumer
+        self.consumer.on_empty = self.client.stop
+
+    # handler收到解码后的ConsumerRecord；一批全部处理完成后才提交，失败的partition不提交并回退到该批的起点
+    def test_process_batches(self):
+        self.consumer.batches = [_records(0, range(0, 2)) | _records(1, range(5, 8)), _records(1, range(5, 8))]
+        events = self.consumer.events
+
+        def handler(records):
+            partition = records[0].partition
+            events.append(('handle', partition, [r.offset for r in records], [r.value for r in records]))
+            if partition == 1 and len([e for e in events if e[0] == 'handle' and e[1] == 1]) == 1:
+                raise RuntimeError('fail once')
+
+        self.client.process_batches(handler, worker_num=1, retry_wait_secs=0)
+        self.assertEqual(events, [
+            ('handle', 0, [0, 1], ['v0', 'v1']),
+            ('handle', 1, [5, 6, 7], ['v5', 'v6', 'v7']),
+            ('commit', {0: 2}),
+            ('seek', 1, 5),
+            ('handle', 1, [5, 6, 7], ['v5', 'v6', 'v7']),
+            ('commit', {1: 8}),
+        ])
+
+    # rebalance导致提交失败时记录日志并继续读取
+    def test_commit_failed(self):
+        self.consumer.batches = [_records(0, range(0, 2)), _records(0, range(2, 4))]
+        self.consumer.commit_errors = 1
+        batches = list(self.client.read_batches())
+        self.assertEqual(batches, [['v0', 'v1'], ['v2', 'v3'], []])
+        self.assertEqual(self.consumer.events, [('commit', {0: 2}), ('commit', {0: 4})])
+
+    def test_auto_commit(self):
+        client = kafka_client.KafkaConsumerClient('localhost:9092', 'topic')
+        with self.assertRaises(RuntimeError):
+            next(client.read_batches())
@@ -0,0 +1,44 @@
+from unittest import TestCase
+from wbximy_common.clients.sql_stats import sql_fingerprint, SQLStats
+
+
+class TestSQLStats(TestCase):
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            sql_fingerprint("select * from db.tb_2024 where id in (1, 2,3) and name='a''b' limit 10"),
+            'select * from db.tb_2024 where id in (?+) and name=? limit ?',
+        )
+        self.assertEqual(
+            sql_fingerprint('select * from db.tb where id in %s and x=%(x)s  -- c\n limit 1'),
+            'select * from db.tb where id in (?+) and x=? limit ?',
+        )
+        self.assertEqual(
+            sql_fingerprint("insert into db.tb (a, b) values (1,'x'),(2,NULL)"),
+            'insert into db.tb (a, b) values (?,?)',
+        )
+
+    def test_snapshot(self):
+        stats = SQLStats()
+        for i in range(100):
+            stats.record('localhost:3306', f'select * from tb where id={i}', cost=i / 1000, rows=1)
+        stats.record('localhost:3306', 'select * from tb where id=1', cost=0.1, error=True)
+        items = stats.snapshot()
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0]['calls'], 101)
+        self.assertEqual(items[0]['rows'], 100)
+        self.assertEqual(items[0]['errors'], 1)
+        self.assertLess(items[0]['p50_secs'], items[0]['p99_secs'])
+        self.assertEqual(items[0]['max_secs'], 0.1)
+
+    def test_long_sql(self):
+        values = ','.join(f"({i},'name {i}',NULL)" for i in range(2000))
+        self.assertEqual(
+            sql_fingerprint(f'insert ignore into db.tb (id, name, x) values {values}'),
+            'insert ignore into db.tb (id, name, x) values (?,?,?) ...',
+        )
+        ids = ','.join(str(i) for i in range(2000))
+        self.assertEqual(
+            sql_fingerprint(f'select * from db.tb where id in ({ids}) and x=1'),
+            'select * from db.tb where id in (?+) ...',
+        )
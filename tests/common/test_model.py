@@ -0,0 +1,41 @@
+from unittest import TestCase
+from wbximy_common.common.model import CustomBaseModel
+
+
+class Item(CustomBaseModel):
+    id: int = 0
+    name: str = ''
+    score: int = 0
+
+
+class TestCustomBaseModel(TestCase):
+
+    def test_dirty_fields(self):
+        item = Item(id=1, name='a')
+        self.assertIsNone(item.dirty_fields())
+        self.assertEqual(item.to_dirty_dict(), item.to_dict())
+
+        item = Item.from_dict({'id': 1, 'name': 'a', 'score': 1})
+        self.assertEqual(item.dirty_fields(), set())
+        item.score = 2
+        self.assertEqual(item.to_dirty_dict(), {'score': 2})
+
+        copied = item.model_copy()
+        copied.name = 'b'
+        self.assertEqual(item.dirty_fields(), {'score'})
+        self.assertEqual(copied.dirty_fields(), {'score', 'name'})
+
+        item.mark_clean()
+        self.assertEqual(item.to_dirty_dict(), {})
+
+    def test_from_dict_list(self):
+        ds = [{'id': 1, 'name': 'a'}, None, {'id': 'x'}, {'id': '3', 'score': 5}]
+        items = Item.from_dict_list(ds)
+        self.assertEqual([item and item.id for item in items], [1, None, None, 3])
+        self.assertEqual(items[3].dirty_fields(), set())
+
+        items = Item.from_dict_list(ds[:2], trusted=True)
+        self.assertEqual(items[0].to_dict(), {'id': 1, 'name': 'a', 'score': 0})
+        self.assertIsNone(items[1])
+        items[0].score = 1
+        self.assertEqual(items[0].to_dirty_dict(), {'score': 1})
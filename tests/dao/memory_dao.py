@@ -0,0 +1,68 @@
+import re
+import time
+from typing import List, Dict
+from wbximy_common.dao.mysql_dao import MySQLDao
+
+_SELECT_PAT = re.compile(r'select \* from \S+\s*(?:where (?P<where>.*?))?\s*(?:order by (?P<order>.*?))?\s*'
+                         r'(?:limit (?P<limit>\S+))?$')
+_COND_PAT = re.compile(r'(?P<lhs>\(.*?\)|\w+)\s*(?P<op>>|<=|=|is)\s*(?P<rhs>\(.*?\)|%\(\w+\)s|%s)')
+_PARAM_PAT = re.compile(r'%\((\w+)\)s|%s')
+_OPS = {'>': lambda a, b: a > b, '<=': lambda a, b: a <= b, '=': lambda a, b: a == b, 'is': lambda a, b: a == b}
+
+
+# 内存中的表：支持Dao生成的 select * from tb where ... order by ... limit ... 形式的SQL，不需要MySQL
+class MemoryDao(MySQLDao):
+    def __init__(self, rows: List[Dict], batch_size: int = 4, db_tb_name: str = 'db.tb', **kwargs):
+        # 默认lazy_init，select/select_many被覆盖后不会创建连接
+        super().__init__(db_tb_name=db_tb_name, batch_size=batch_size, host='memory', user='', password='',
+                         tunnel=False, **kwargs)
+        self.rows: List[Dict] = rows
+        self.fail = None  # 不为None时查询抛出该异常
+        self.delay = 0.0  # 查询耗时 秒
+        self.queries: List[str] = []  # 执行过的SQL
+
+    def select_many(self, sql: str, args=None, stream=False, fetch_size=None):
+        time.sleep(self.delay)
+        if self.fail is not None:
+            raise self.fail
+        self.queries.append(sql)
+        mo = _SELECT_PAT.match(sql.strip())
+        positional = iter(args if isinstance(args, (list, tuple)) else ())
+
+        def _value(placeholder):
+            values = [args[name] if name else next(positional) for name in _PARAM_PAT.findall(placeholder)]
+            return tuple(values) if placeholder.startswith('(') else values[0]
+
+        conditions = [(cond.group('lhs'), cond.group('op'), _value(cond.group('rhs')))
+                      for cond in _COND_PAT.finditer(mo.group('where') or '')]
+        rows = [d for d in self.rows if all(_OPS[op](self._column(d, lhs), v) for lhs, op, v in conditions)]
+        if mo.group('order'):
+            order, desc = mo.group('order'), mo.group('order').endswith(' desc')
+            columns = order[:-len(' desc')] if desc else order
+            rows = sorted(rows, key=lambda d: self._column(d, f'({columns})'), reverse=desc)
+        limit = mo.group('limit')
+        limit = None if limit is None else int(limit) if limit.isdigit() else _value(limit)
+        return [dict(d) for d in rows[:limit]]
+
+    @staticmethod
+    def _column(d: Dict, lhs: str):
+        if lhs.startswith('('):
+            return tuple(d[c.strip()] for c in lhs[1:-1].split(','))
+        return d[lhs]
+
+    def select(self, sql: str, args=None):
+        key = re.search(r'min\((\w+)\)', sql).group(1)
+        values = [d[key] for d in self.rows]
+        return {'min_key': min(values, default=None), 'max_key': max(values, default=None)}
+
+
+# 代替offsets_cache使用的RedisHash
+class MemoryHash(dict):
+    def get_many(self, keys: List[str]) -> List:
+        return [self.get(key) for key in keys]
+
+    def set_many(self, mapping: Dict):
+        self.update(mapping)
+
+    def set(self, key, value):
+        self[key] = value
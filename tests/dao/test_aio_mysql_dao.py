@@ -0,0 +1,57 @@
+from unittest import IsolatedAsyncioTestCase
+from wbximy_common.common.model import CustomBaseModel
+from wbximy_common.dao.aio_mysql_dao import AioMySQLDao
+from tests.clients.test_aio_mysql_client import FakePoolMixin
+from tests.dao.memory_dao import MemoryDao
+
+
+class Item(CustomBaseModel):
+    id: int = 0
+    score: int = 0
+
+
+# 查询由MemoryDao计算结果，写入只记录SQL
+class TestAioMySQLDao(FakePoolMixin, IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rows = [{'id': i, 'score': s} for i, s in enumerate([0, 1, 1, 1, 1, 1, 1, 2, 2, 3])]
+        self.memory = MemoryDao(self.rows)
+        self.writes = []
+
+    def handle(self, sql, args):
+        if sql.startswith('select'):
+            rows = self.memory.select_many(sql, args)
+            return rows, len(rows), 0
+        self.writes.append((sql, args))
+        return [], 1, 100
+
+    def _dao(self, **kwargs) -> AioMySQLDao:
+        return AioMySQLDao(db_tb_name='db.tb', batch_size=4, host='db.test', user='u', password='p', tunnel=False,
+                           **kwargs)
+
+    async def test_get(self):
+        dao = self._dao(entity_class=Item)
+        self.assertEqual((await dao.get_by_id(3)).to_dict(), {'id': 3, 'score': 1})
+        self.assertIsNone(await dao.get(score=5))
+        items = [o async for o in dao.get_many(score=1, limit=10)]
+        self.assertEqual([o.id for o in items], [1, 2, 3, 4, 5, 6])
+
+    async def test_save_by_id(self):
+        dao = self._dao()
+        d = {'id': 0, 'score': 7}
+        self.assertTrue(await dao.save_by_id(d))
+        self.assertEqual(d['id'], 100)
+        self.assertTrue(await dao.save_by_id({'id': 3, 'score': 8}))
+        self.assertEqual([sql for sql, _ in self.writes], [
+            'insert ignore db.tb set score=%(score)s',
+            'update db.tb set score=%(score)s where id=%(id)s limit 1',
+        ])
+
+    # 与MySQLDao.scan_iter一致：同值的数据不分在两批，多列时按keyset推进
+    async def test_scan_iter(self):
+        dao = self._dao()
+        self.assertEqual(await dao.scan_iter(-1, 'score', 2), (1, self.rows[:7]))
+        self.assertEqual(await dao.scan_iter((1, 3), ('score', 'id'), 2), ((1, 5), self.rows[4:6]))
+        self.assertEqual([d async for d in dao.scan((-1, -1), scan_key=('score', 'id'))], self.rows)
+        self.assertEqual(self.pools[0].acquired, 0)
@@ -1,6 +1,7 @@
 from unittest import TestCase
 from wbximy_common.dao.mysql_dao import MySQLDao
 from wbximy_common.libs.env import ConstantProps
+from tests.dao.memory_dao import MemoryDao, MemoryHash
 
 
 class TestMySQLDao(TestCase):
@@ -9,3 +10,40 @@ class TestMySQLDao(TestCase):
         print(dao.get_by_id(2))
 
 
+class TestScanIter(TestCase):
+
+    # scan_key不唯一时同值的数据不能被分在两批，每次查询最多count条
+    def test_1(self):
+        rows = [{'id': i, 'score': s} for i, s in enumerate([0, 1, 1, 1, 1, 1, 1, 2, 2, 3])]
+        dao = MemoryDao(rows)
+        self.assertEqual(dao.scan_iter(-1, 'score', 2), (1, rows[:7]))
+        self.assertEqual(len(dao.queries), 4)
+        self.assertEqual(dao.scan_iter(1, 'score', 2), (2, rows[7:9]))
+        self.assertEqual(dao.scan_iter(2, 'score', 2), (3, rows[9:]))
+        self.assertEqual(dao.scan_iter(3, 'score', 2), (3, []))
+        self.assertEqual(dao.scan_iter(3, 'id', 2), (5, rows[4:6]))
+
+    def test_keyset(self):
+        rows = [{'id': i, 'score': s} for i, s in enumerate([0, 1, 1, 1, 1, 1, 1, 2, 2, 3])]
+        dao = MemoryDao(rows)
+        self.assertEqual(dao.scan_iter((1, 3), ('score', 'id'), 2), ((1, 5), rows[4:6]))
+        items = [d for d in dao.scan((-1, -1), scan_key=('score', 'id'))]
+        self.assertEqual(items, rows)
+
+
+class TestPartitionScan(TestCase):
+
+    def test_1(self):
+        rows = [{'id': i} for i in range(1, 51)]
+        dao = MemoryDao(rows, batch_size=4)
+        offsets_cache = MemoryHash()
+        ids = [d['id'] for items in dao.partition_scan(part_num=4, worker_num=2, offsets_cache=offsets_cache)
+               for d in items]
+        self.assertEqual(sorted(ids), list(range(1, 51)))
+        # 从offsets_cache恢复：已经扫描完成
+        self.assertEqual(list(dao.partition_scan(part_num=4, offsets_cache=offsets_cache)), [])
+
+    def test_empty_table(self):
+        offsets_cache = MemoryHash()
+        self.assertEqual(list(MemoryDao([]).partition_scan(offsets_cache=offsets_cache)), [])
+        self.assertEqual(offsets_cache, {})
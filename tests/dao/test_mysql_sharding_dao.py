@@ -0,0 +1,152 @@
+import time
+from typing import List, Dict
+from unittest import TestCase
+from wbximy_common.dao.mysql_dao import MySQLDao
+from wbximy_common.dao.mysql_sharding_dao import MySQLShardingDao
+from tests.dao.memory_dao import MemoryDao, MemoryHash
+
+class MemoryShardingDao(MySQLShardingDao):
+    @classmethod
+    def do_sharding(cls, v) -> int:
+        return v % 3
+
+    @classmethod
+    def get_sharding_dao_list(cls, rows: List[Dict] = (), batch_size: int = 4) -> List[MySQLDao]:
+        return [MemoryDao([d for d in rows if cls.do_sharding(d['id']) == part_id], batch_size=batch_size)
+                for part_id in range(3)]
+
+
+class TestScatterGetMany(TestCase):
+
+    def test_1(self):
+        rows = [{'id': i, 'type': i % 2, 'score': (i * 7) % 11} for i in range(1, 31)]
+        dao = MemoryShardingDao(rows=rows)
+        expected = sorted((d for d in rows if d['type'] == 1), key=lambda d: d['score'], reverse=True)
+        items = list(dao.scatter_get_many(limit=5, order_by='score', desc=True, type=1))
+        self.assertEqual([d['score'] for d in items], [d['score'] for d in expected[:5]])
+        self.assertEqual(len(list(dao.scatter_get_many(limit=100, type=1))), 15)
+        # 包含分表键时只查询对应分表
+        self.assertEqual(list(dao.scatter_get_many(id=4)), [rows[3]])
+        self.assertIsNone(dao.scatter_get(id=100))
+
+    def test_failures(self):
+        rows = [{'id': i} for i in range(1, 31)]
+        dao = MemoryShardingDao(rows=rows)
+        dao.mysql_dao_list[1].fail = RuntimeError('down')
+        failures = dict()
+        ids = [d['id'] for d in dao.scatter_get_many(limit=100, order_by='id', failures=failures)]
+        self.assertEqual(ids, [i for i in range(1, 31) if i % 3 != 1])
+        self.assertEqual(list(failures), [1])
+        with self.assertRaises(RuntimeError):
+            list(dao.scatter_get_many(limit=100))
+
+        dao.mysql_dao_list[1].fail = None
+        dao.mysql_dao_list[2].delay = 0.5
+        failures = dict()
+        ids = [d['id'] for d in dao.scatter_get_many(limit=100, order_by='id', timeout=0.1, failures=failures)]
+        self.assertEqual(ids, [i for i in range(1, 31) if i % 3 != 2])
+        self.assertIsInstance(failures[2], TimeoutError)
+
+    # 无序时先完成的分表先返回，不等待慢的分表
+    def test_stream(self):
+        rows = [{'id': i} for i in range(1, 31)]
+        dao = MemoryShardingDao(rows=rows)
+        dao.mysql_dao_list[2].delay = 0.5
+        before = time.monotonic()
+        items = dao.scatter_get_many(limit=100)
+        next(items)
+        self.assertLess(time.monotonic() - before, 0.4)
+        self.assertEqual(len(list(items)), 29)
+
+    # 超时包括排队等待线程的时间：卡住的分表占满线程后，后续调用仍然按时返回
+    def test_timeout_queued(self):
+        rows = [{'id': i} for i in range(1, 31)]
+        dao = MemoryShardingDao(rows=rows, scatter_worker_num=1)
+        dao.mysql_dao_list[0].delay = 1.0
+        for order_by in ('id', None):
+            failures = dict()
+            before = time.monotonic()
+            items = dao.scatter_get_many(limit=100, order_by=order_by, timeout=0.2, failures=failures)
+            self.assertEqual(list(items), [])
+            self.assertLess(time.monotonic() - before, 0.6)
+            self.assertEqual(sorted(failures), [0, 1, 2])
+
+
+class TestShardingScan(TestCase):
+
+    def test_1(self):
+        rows = [{'id': i} for i in range(1, 31)]
+        dao = MemoryShardingDao(rows=rows)
+        offsets_cache = MemoryHash()
+        ids = [d['id'] for items in dao.sharding_scan(offsets_cache, start=0, worker_num=2) for d in items]
+        self.assertEqual(sorted(ids), list(range(1, 31)))
+        self.assertEqual(offsets_cache, {'000': 30, '001': 28, '002': 29})
+        # 从offsets_cache继续：每个分表读取为空后不再读取，全部为空后退出
+        self.assertEqual(list(dao.sharding_scan(offsets_cache, start=0, worker_num=2)), [[], [], []])
+
+    # 空闲分表调度前从offsets_cache重新加载偏移量
+    def test_reload_offset(self):
+        rows = [{'id': i} for i in range(1, 31)]
+        dao = MemoryShardingDao(rows=rows)
+        offsets_cache = MemoryHash()
+        ids = []
+        for items in dao.sharding_scan(offsets_cache, start=0, worker_num=1):
+            if not ids:
+                offsets_cache['001'] = 22
+            ids += [d['id'] for d in items]
+        self.assertEqual(sorted(ids), [i for i in range(1, 31) if i % 3 != 1 or i > 22])
+
+    # infinite_wait_secs>0 时读取为空的分表等待后重新读取
+    def test_infinite_wait(self):
+        rows = [{'id': i} for i in range(1, 10)]
+        dao = MemoryShardingDao(rows=rows)
+        ids, deadline = [], time.monotonic() + 5
+        for items in dao.sharding_scan(MemoryHash(), start=0, infinite_wait_secs=0.05, worker_num=2):
+            ids += [d['id'] for d in items]
+            if len(ids) == 9 and len(dao.mysql_dao_list[1].rows) == 3:
+                dao.mysql_dao_list[1].rows.append({'id': 100})
+            if 100 in ids or time.monotonic() > deadline:
+                break
+        self.assertEqual(sorted(ids), list(range(1, 10)) + [100])
+
+
+class TestOrderedShardingScan(TestCase):
+    # score不唯一，同值的数据分布在多个分表
+    rows = [{'id': i, 'score': (i * 7) % 13} for i in range(1, 61)]
+
+    def test_1(self):
+        dao = MemoryShardingDao(rows=self.rows, batch_size=4)
+        offsets_cache = MemoryHash()
+        emitted = []
+        for items in dao.sharding_scan(offsets_cache, start=-1, scan_key='score', worker_num=2, ordered=True):
+            self.assertLessEqual(len(items), 4)
+            emitted += items
+            # 检查点之前(含)的数据都已经返回
+            for part_id, part_dao in enumerate(dao.mysql_dao_list):
+                checkpoint = offsets_cache[f'{part_id:03d}']
+                done = [d['id'] for d in part_dao.rows if d['score'] <= checkpoint]
+                self.assertTrue(set(done) <= set(d['id'] for d in emitted))
+        self.assertEqual([d['score'] for d in emitted], sorted(d['score'] for d in self.rows))
+        self.assertEqual(sorted(d['id'] for d in emitted), list(range(1, 61)))
+        self.assertEqual(offsets_cache, {'000': 12, '001': 12, '002': 12})
+
+    # 中途退出后从检查点恢复，不丢数据
+    def test_resume(self):
+        dao = MemoryShardingDao(rows=self.rows, batch_size=4)
+        offsets_cache = MemoryHash()
+        emitted = []
+        for bid, items in enumerate(dao.sharding_scan(offsets_cache, start=-1, scan_key='score', ordered=True)):
+            emitted += items
+            if bid == 5:
+                break
+        resumed = [d for items in dao.sharding_scan(offsets_cache, start=-1, scan_key='score', ordered=True)
+                   for d in items]
+        self.assertEqual([d['score'] for d in resumed], sorted(d['score'] for d in resumed))
+        self.assertEqual(set(d['id'] for d in emitted + resumed), set(range(1, 61)))
+
+    def test_invalid_args(self):
+        dao = MemoryShardingDao(rows=self.rows)
+        with self.assertRaises(RuntimeError):
+            list(dao.sharding_scan(MemoryHash(), start=-1, infinite_wait_secs=1, ordered=True))
+        with self.assertRaises(RuntimeError):
+            list(dao.sharding_scan(MemoryHash(), start=(0, 0), scan_key=('score', 'id'), ordered=True))
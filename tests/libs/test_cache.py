@@ -0,0 +1,34 @@
+import time
+from unittest import TestCase
+from wbximy_common.libs.cache import TTLCache
+
+
+class TestTTLCache(TestCase):
+
+    def test_lru(self):
+        cache = TTLCache(max_entries=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), (True, 1))
+        cache.set('c', 3)
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_ttl(self):
+        cache = TTLCache(ttl=60, negative_ttl=0.05)
+        cache.set('a', 1)
+        cache.set('b', None)
+        self.assertEqual(cache.get('b'), (True, None))
+        time.sleep(0.1)
+        self.assertEqual(cache.get('a'), (True, 1))
+        self.assertEqual(cache.get('b'), (False, None))
+
+    def test_tag(self):
+        cache = TTLCache()
+        cache.set('a', {'id': 1}, tags=[('id', 1)])
+        cache.set('b', {'id': 1}, tags=[('id', 1)])
+        version = cache.version()
+        cache.invalidate_tag(('id', 1))
+        self.assertEqual(len(cache), 0)
+        cache.set('a', {'id': 1}, version=version)
+        self.assertEqual(cache.get('a'), (False, None))
@@ -0,0 +1,33 @@
+import threading
+from unittest import TestCase
+from wbximy_common.libs.concurrent import prefetch
+
+
+class TestPrefetch(TestCase):
+
+    def test_1(self):
+        self.assertEqual(list(prefetch(range(100), depth=2)), list(range(100)))
+
+    def test_error(self):
+        def gen():
+            yield 1
+            raise ValueError('bad batch')
+        it = prefetch(gen(), depth=2)
+        self.assertEqual(next(it), 1)
+        self.assertRaises(ValueError, next, it)
+
+    def test_close(self):
+        produced = []
+
+        def gen():
+            for i in range(100):
+                produced.append(i)
+                yield i
+        it = prefetch(gen(), depth=2, name='test_close')
+        self.assertEqual(next(it), 0)
+        producer = next(t for t in threading.enumerate() if t.name == 'test_close')
+        # 关闭后生产线程应退出，等待其结束而不是固定sleep
+        it.close()
+        producer.join(timeout=5)
+        self.assertFalse(producer.is_alive())
+        self.assertLess(len(produced), 10)
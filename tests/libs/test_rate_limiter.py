@@ -0,0 +1,45 @@
+from unittest import TestCase, skipIf
+from wbximy_common.libs.rate_limiter import TokenBucket, RedisTokenBucket
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class TestTokenBucket(TestCase):
+
+    def test_1(self):
+        bucket = TokenBucket(rate=10, burst=5)
+        self.assertEqual(bucket.reserve(5), 0.0)
+        self.assertAlmostEqual(bucket.reserve(5), 0.5, places=2)
+        self.assertAlmostEqual(bucket.reserve(1), 0.6, places=2)
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestRedisTokenBucket(TestCase):
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.bucket = RedisTokenBucket(self.redis, 'test_bucket', rate=10, burst=5)
+
+    # 把上次预定的时间往前移动secs秒，模拟经过的时间
+    def _elapse(self, secs: float):
+        ts = float(self.redis.hget('test_bucket', 'ts'))
+        self.redis.hset('test_bucket', 'ts', str(ts - secs))
+
+    def test_burst(self):
+        self.assertEqual(self.bucket.reserve(5), 0.0)
+        self.assertAlmostEqual(self.bucket.reserve(5), 0.5, places=2)
+        self.assertAlmostEqual(self.bucket.reserve(1), 0.6, places=2)
+        self.assertGreater(self.redis.ttl('test_bucket'), 0)
+
+    def test_refill(self):
+        self.assertAlmostEqual(self.bucket.reserve(6), 0.1, places=2)
+        self._elapse(0.5)
+        self.assertEqual(self.bucket.reserve(4), 0.0)
+        self.assertAlmostEqual(self.bucket.reserve(1), 0.1, places=2)
+        # 补充的令牌不超过burst
+        self._elapse(100)
+        self.assertEqual(self.bucket.reserve(5), 0.0)
+        self.assertAlmostEqual(self.bucket.reserve(1), 0.1, places=2)
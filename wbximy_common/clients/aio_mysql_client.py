@@ -0,0 +1,254 @@
+# encoding=utf8
+
+import time
+import asyncio
+import logging
+from typing import Optional, AsyncGenerator, Dict, Tuple
+import aiomysql
+from wbximy_common.clients.mysql_client import MySQLClient
+from wbximy_common.clients.sql_stats import SQLStats
+from wbximy_common.clients.tunnel import TunnelMixin
+from wbximy_common.libs.rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class AioConnection:
+    def __init__(
+            self,
+            pool: aiomysql.Pool,
+            transaction=False,
+            cursor_class=None,  # None表示使用连接池默认的cursor_class
+            stats: Optional[SQLStats] = None,
+            server: str = '',
+            slow_query_secs: float = 5.0,
+    ):
+        self.pool = pool
+        self.conn: Optional[aiomysql.Connection] = None
+        self.cursor: Optional[aiomysql.Cursor] = None
+        self.transaction = transaction
+        self.cursor_class = cursor_class
+        self.stats = stats
+        self.server = server
+        self.slow_query_secs = slow_query_secs
+        self._discarded = False
+
+    async def __aenter__(self):
+        self.conn = await self.pool.acquire()
+        if self.transaction:
+            await self.conn.begin()
+        self.cursor = await (self.conn.cursor(self.cursor_class) if self.cursor_class else self.conn.cursor())
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if self._discarded:
+                self.conn.close()
+                return
+            await self.cursor.close()
+            if self.transaction:
+                await self.conn.commit()
+        finally:
+            self.pool.release(self.conn)
+
+    async def execute(self, sql, args):
+        before_exec_time = time.time()
+        logger.debug('conn=%s sql=%s args=%s', id(self.conn), sql, args)
+        try:
+            ret = await self.cursor.execute(sql, args)
+        except Exception as e:
+            logger.warning('error sql=%s, args=%s e=%s', sql, args, e)
+            if self.stats is not None:
+                self.stats.record(self.server, sql, time.time() - before_exec_time, error=True)
+            raise e
+        exec_time = time.time() - before_exec_time
+        if self.stats is not None:
+            self.stats.record(self.server, sql, exec_time, rows=ret if 0 <= ret < 2 ** 63 else 0)
+        if exec_time > self.slow_query_secs:
+            logger.warning('slow query sql=%s args=%s cost=%.2f', sql, args, exec_time)
+        return ret
+
+    # 流式读取中途放弃时调用：退出时直接关闭连接，不读完剩余结果，也不放回连接池
+    def discard_unbuffered(self):
+        self._discarded = True
+
+
+# MySQLClient的asyncio版本，基于aiomysql连接池，接口与MySQLClient一致
+# 连接池绑定event loop，按 host:port + event loop 共享
+# 缓存以loop对象(而不是id，loop释放后id可能被复用)为key，已关闭loop的条目在下次创建连接池时清理
+class AioMySQLClient(TunnelMixin):
+
+    _conn_pool_cache: Dict[Tuple[str, asyncio.AbstractEventLoop], aiomysql.Pool] = dict()  # (host:port, loop) -> pool
+    _conn_pool_cache_locks: Dict[asyncio.AbstractEventLoop, asyncio.Lock] = dict()  # loop -> lock
+
+    def __init__(
+            self,
+            host: str,
+            user: str,
+            password: str,
+            port: int = 3306,
+            tunnel: Optional[bool] = None,
+            can_share: bool = True,  # 当host/port 一致时 共享连接池
+            max_connections: int = 16,  # 连接池最大连接数
+            max_write_per_minute: int = -1,  # -1为不限制 每分钟写入(insert/update)速度控制
+            max_write_per_second: float = -1,  # -1为不限制 每秒写入速度控制 优先于max_write_per_minute
+            write_burst: float = None,  # 写入速度控制允许的突发量 默认为1秒的写入量
+            write_limiter: Optional[TokenBucket] = None,  # 共享的限速器 如RedisTokenBucket 优先于以上配置
+            auto_limit: bool = True,  # SQL语句是否补全limit
+            stream_fetch_size: int = 1000,  # select_many(stream=True) 每次fetchmany的行数
+            slow_query_secs: float = 5.0,  # 超过该耗时的SQL打印warning
+            collect_sql_stats: bool = True,  # 是否记录到全局SQL统计 与MySQLClient共用 见MySQLClient.get_sql_stats
+    ):
+        super().__init__()
+        self.host, self.port, self.tunnel = host, port, tunnel
+        self.mix()
+        self._can_share: bool = can_share
+        self._user: str = user
+        self._password: str = password
+        self._conn_pool: Optional[aiomysql.Pool] = None
+        self._conn_pool_loop: Optional[asyncio.AbstractEventLoop] = None  # _conn_pool所属的event loop
+        self._max_connections = max_connections
+        self._write_limiter: Optional[TokenBucket] = write_limiter  # 速度控制 insert+update
+        if self._write_limiter is None and max_write_per_second > 0:
+            self._write_limiter = TokenBucket(rate=max_write_per_second, burst=write_burst)
+        elif self._write_limiter is None and max_write_per_minute > 0:
+            self._write_limiter = TokenBucket(rate=max_write_per_minute / 60, burst=write_burst)
+        self._auto_limit = auto_limit
+        self._stream_fetch_size = stream_fetch_size
+        self._slow_query_secs = slow_query_secs
+        self._collect_sql_stats = collect_sql_stats
+
+    async def _init_conn_pool(self) -> aiomysql.Pool:
+        loop = asyncio.get_running_loop()
+        if self._conn_pool is not None and self._conn_pool_loop is loop and not self._conn_pool.closed:
+            return self._conn_pool
+        if loop not in self._conn_pool_cache_locks:
+            self._purge_closed_loops()
+        lock = self._conn_pool_cache_locks.setdefault(loop, asyncio.Lock())
+        async with lock:
+            host_port = '{}:{}'.format(self.host, self.port)
+            self._conn_pool_loop = loop
+            if self._can_share and (host_port, loop) in self._conn_pool_cache:
+                pool = self._conn_pool_cache[(host_port, loop)]
+                if not pool.closed:
+                    logger.info('aio pool using cache for %s', host_port)
+                    self._conn_pool = pool
+                    return self._conn_pool
+            self._conn_pool = await aiomysql.create_pool(
+                minsize=1,
+                maxsize=self._max_connections,
+                host=self.host,
+                port=self.port,
+                user=self._user,
+                password=self._password,
+                db=None,  # 连接池可以跨database，所以创建连接池时，不指定database
+                charset='utf8mb4',
+                autocommit=True,
+                cursorclass=aiomysql.DictCursor,
+            )
+            logger.info('new aio conn pool for %s', host_port)
+            if self._can_share:
+                self._conn_pool_cache[(host_port, loop)] = self._conn_pool
+            return self._conn_pool
+
+    # 已关闭的loop上的连接池无法再使用，也无法正常关闭，直接丢弃
+    @classmethod
+    def _purge_closed_loops(cls):
+        for key in [k for k in list(cls._conn_pool_cache) if k[1].is_closed()]:
+            cls._conn_pool_cache.pop(key, None)
+        for loop in [k for k in list(cls._conn_pool_cache_locks) if k.is_closed()]:
+            cls._conn_pool_cache_locks.pop(loop, None)
+
+    # 关闭当前event loop下的所有共享连接池
+    @classmethod
+    async def close_all(cls):
+        loop = asyncio.get_running_loop()
+        for key in [k for k in cls._conn_pool_cache if k[1] is loop]:
+            pool = cls._conn_pool_cache.pop(key)
+            pool.close()
+            await pool.wait_closed()
+
+    async def get_conn(self, transaction=False, cursor_class=None) -> AioConnection:
+        pool = await self._init_conn_pool()
+        return AioConnection(
+            pool,
+            transaction=transaction,
+            cursor_class=cursor_class,
+            stats=MySQLClient._sql_stats if self._collect_sql_stats else None,
+            server='{}:{}'.format(self.host, self.port),
+            slow_query_secs=self._slow_query_secs,
+        )
+
+    # 本地TokenBucket的预定只是加锁计算；其他实现(如RedisTokenBucket)有网络IO，放到线程中执行避免阻塞event loop
+    async def _do_write_check(self, incr):
+        wait = await self._charge_write(incr)
+        await asyncio.sleep(wait)
+
+    # 预定令牌但不等待，返回需要等待的秒数；写入后补扣超出的行数时直接调用，透支的部分由后续写入等待
+    async def _charge_write(self, incr) -> float:
+        if self._write_limiter is None or incr <= 0:
+            return 0.0
+        if type(self._write_limiter) is TokenBucket:
+            return self._write_limiter.reserve(incr)
+        return await asyncio.to_thread(self._write_limiter.reserve, incr)
+
+    async def select(self, sql: str, args=None) -> Optional[dict]:
+        async with await self.get_conn() as conn:
+            if self._auto_limit and ' limit ' not in sql:
+                sql = sql + ' limit 1'
+                logger.debug('modified sql=%s', sql)
+            await conn.execute(sql, args)
+            return await conn.cursor.fetchone()
+
+    # stream=True 时基于SSDictCursor流式读取，不补全limit，内存占用与结果集大小无关
+    async def select_many(self, sql: str, args=None, stream=False, fetch_size=None) -> AsyncGenerator[dict, None]:
+        if stream:
+            # 嵌套的async generator需要显式aclose，否则调用方提前退出时连接要等到gc才释放
+            results = self._select_stream(sql, args, fetch_size=fetch_size or self._stream_fetch_size)
+            try:
+                async for result in results:
+                    yield result
+            finally:
+                await results.aclose()
+            return
+        async with await self.get_conn() as conn:
+            if self._auto_limit and ' limit ' not in sql:
+                sql = sql + ' limit 40000'
+                logger.debug('modified sql=%s', sql)
+            await conn.execute(sql, args)
+            for result in await conn.cursor.fetchall():
+                yield result
+
+    async def _select_stream(self, sql: str, args, fetch_size: int) -> AsyncGenerator[dict, None]:
+        finished, rows = False, 0
+        async with await self.get_conn(cursor_class=aiomysql.SSDictCursor) as conn:
+            try:
+                await conn.execute(sql, args)
+                while True:
+                    results = await conn.cursor.fetchmany(fetch_size)
+                    if not results:
+                        break
+                    rows += len(results)
+                    for result in results:
+                        yield result
+                finished = True
+            finally:
+                if not finished:
+                    conn.discard_unbuffered()
+                if conn.stats is not None:
+                    conn.stats.add_rows(conn.server, sql, rows)
+
+    # 返回变更的行数 写入前先获取1个令牌，超出的行数在写入后补扣
+    async def execute(self, sql: str, args=None) -> int:
+        await self._do_write_check(incr=1)
+        async with await self.get_conn() as conn:
+            rows_affected = await conn.execute(sql, args)
+        await self._charge_write(incr=rows_affected - 1)
+        return rows_affected
+
+    # 返回生效的row_id
+    async def insert(self, sql: str, args=None) -> int:
+        await self._do_write_check(incr=1)
+        async with await self.get_conn() as conn:
+            await conn.execute(sql, args)
+            return conn.cursor.lastrowid
@@ -2,17 +2,37 @@
 
 import re
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Callable, List, Dict, Generator
 from kafka import KafkaProducer, KafkaConsumer
 from kafka.consumer.fetcher import ConsumerRecord
-from kafka.errors import KafkaError
+from kafka.errors import KafkaError, CommitFailedError
+from kafka.producer.future import FutureRecordMetadata, RecordMetadata
+from kafka.structs import TopicPartition, OffsetAndMetadata
 from wbximy_common.clients.tunnel import TunnelMixin
 
 logger = logging.getLogger(__name__)
 
 
+# async_mode=False 时每条消息发送后flush，等待写入完成(兼容原有行为)
+# async_mode=True 时只放入发送缓冲区，由producer按linger_ms/batch_size攒批发送，结果通过回调或future获得
+# 未确认的消息数不超过max_in_flight，超过时write阻塞等待，close/flush时等待全部发送完成
 class KafkaProducerClient(TunnelMixin):
 
-    def __init__(self, bootstrap_servers: str, kafka_topic: str):
+    def __init__(
+            self,
+            bootstrap_servers: str,
+            kafka_topic: str,
+            async_mode: bool = False,
+            linger_ms: int = 0,  # 攒批等待的毫秒数 async_mode时建议5~50
+            batch_size: int = 16384,  # 每个partition一批的最大字节数
+            compression_type: Optional[str] = None,  # None/'gzip'/'snappy'/'lz4' snappy和lz4需要安装对应的包
+            max_in_flight: int = 10000,  # 已发送未确认的最大消息数
+            on_success: Optional[Callable[[str, RecordMetadata], None]] = None,  # 写入成功回调 (message, metadata)
+            on_error: Optional[Callable[[str, Exception], None]] = None,  # 写入失败回调 (message, exception)
+            **kwargs,  # 其他KafkaProducer参数
+    ):
         super().__init__()
         self.kafka_topic: str = kafka_topic
         self.tunnel = False  # 公司内部KAFKA需要挂VPN连接 所以 强制设置 不建隧道
@@ -23,24 +43,83 @@ class KafkaProducerClient(TunnelMixin):
         if mo:
             bootstrap_servers = '{}:{}'.format(self.host, self.port)
         logger.info('init kafka producer %s ...', bootstrap_servers)
-        self.producer = KafkaProducer(bootstrap_servers=bootstrap_servers)
+        self.producer = KafkaProducer(
+            bootstrap_servers=bootstrap_servers,
+            linger_ms=linger_ms,
+            batch_size=batch_size,
+            compression_type=compression_type,
+            **kwargs,
+        )
+        self.async_mode: bool = async_mode
+        self.on_success = on_success
+        self.on_error = on_error
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.success_count: int = 0
+        self.error_count: int = 0
         logger.info('init kafka producer done. %s %s', bootstrap_servers, self.kafka_topic)
 
+    def _on_success(self, message: str, metadata: RecordMetadata):
+        self._in_flight.release()
+        with self._lock:
+            self.success_count += 1
+        if self.on_success is not None:
+            self.on_success(message, metadata)
+
+    def _on_error(self, message: str, e: Exception):
+        self._in_flight.release()
+        with self._lock:
+            self.error_count += 1
+        logger.warning('fail write message=%s e=%s', message, e)
+        if self.on_error is not None:
+            self.on_error(message, e)
+
+    # 放入发送缓冲区，返回future(FutureRecordMetadata)，未确认的消息数达到max_in_flight时阻塞
+    def send(self, message: str, key=None) -> FutureRecordMetadata:
+        if isinstance(key, str):
+            key = key.encode('utf8')
+        self._in_flight.acquire()
+        try:
+            future = self.producer.send(topic=self.kafka_topic, key=key, value=message.encode('utf8'))
+        except Exception as e:
+            self._in_flight.release()
+            raise e
+        future.add_callback(self._on_success, message)
+        future.add_errback(self._on_error, message)
+        return future
+
+    # async_mode时返回是否放入发送缓冲区，否则返回是否写入成功
     def write(self, message: str, **kwargs) -> bool:
         key = kwargs.pop('key', None)
         try:
-            self.producer.send(
-                topic=self.kafka_topic,
-                key=key,
-                value=message.encode('utf8'),
-            )
+            future = self.send(message, key=key)
         except KafkaError as e:
             logger.warning('fail write message=%s e=%s', message, e)
             return False
+        if self.async_mode:
+            return True
+        self.producer.flush()
+        return future.succeeded()
+
+    # 批量写入，keys与messages一一对应；async_mode时返回放入发送缓冲区的条数，否则flush一次后返回写入成功的条数
+    def write_many(self, messages: List[str], keys: List = None) -> int:
+        futures = []
+        for message, key in zip(messages, keys or [None] * len(messages)):
+            try:
+                futures.append(self.send(message, key=key))
+            except KafkaError as e:
+                logger.warning('fail write message=%s e=%s', message, e)
+        if self.async_mode:
+            return len(futures)
         self.producer.flush()
-        return True
+        return sum(1 for future in futures if future.succeeded())
+
+    # 等待缓冲区中的消息全部发送完成
+    def flush(self, timeout: float = None):
+        self.producer.flush(timeout=timeout)
 
     def close(self):
+        self.producer.flush()
         self.producer.close()
 
 
@@ -69,6 +148,7 @@ class KafkaConsumerClient(TunnelMixin):
             auto_commit_interval_ms=100,
             auto_offset_reset=auto_offset_reset,  # {'smallest': 'earliest', 'largest': 'latest'}
         )
+        self._stop_event = threading.Event()
         logger.info('init kafka consumer done. %s', self.kafka_topic)
 
     def read(self, **kwargs):
@@ -80,5 +160,79 @@ class KafkaConsumerClient(TunnelMixin):
                 data = data.decode('utf8')
             yield data
 
+    # 批量读取，每批至多max_records条，等待至多timeout秒，没有数据时返回空列表
+    # 需要auto_commit=False：一批数据在调用方处理完(请求下一批)后才提交offset，进程崩溃时未处理完的数据会被重新消费
+    def read_batches(
+            self,
+            max_records: int = 500,
+            timeout: float = 1.0,
+            utf8_decode: bool = True,
+    ) -> Generator[List, None, None]:
+        self._check_manual_commit()
+        self._stop_event.clear()
+        while not self._stop_event.is_set():
+            records = self.consumer.poll(timeout_ms=int(timeout * 1000), max_records=max_records)
+            yield [self._decode(r, utf8_decode) for tp_records in records.values() for r in tp_records]
+            self._commit(records)
+
+    # 批量读取并用worker_num个线程处理：不同partition并行，同一partition的数据按顺序交给一次handler调用
+    # handler收到ConsumerRecord列表(value已按utf8_decode解码)，可以取得topic/partition/offset用于去重或记录进度
+    # 一批全部处理完成后提交成功的partition；handler失败的partition回退到该批的起点，下一轮重新消费
+    # 需要auto_commit=False，调用stop()后退出
+    def process_batches(
+            self,
+            handler: Callable[[List[ConsumerRecord]], None],
+            worker_num: int = 4,
+            max_records: int = 500,
+            timeout: float = 1.0,
+            utf8_decode: bool = True,
+            retry_wait_secs: float = 1.0,  # 有失败的partition时 等待后再读取下一批
+    ):
+        self._check_manual_commit()
+        self._stop_event.clear()
+        with ThreadPoolExecutor(max_workers=worker_num, thread_name_prefix='kafka_process') as executor:
+            while not self._stop_event.is_set():
+                records = self.consumer.poll(timeout_ms=int(timeout * 1000), max_records=max_records)
+                futures: Dict[TopicPartition, Future] = {
+                    tp: executor.submit(handler, [r._replace(value=self._decode(r, utf8_decode)) for r in tp_records])
+                    for tp, tp_records in records.items() if tp_records
+                }
+                failed = dict()
+                for tp, future in futures.items():
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.warning(f'process fail {tp} offset={records[tp][0].offset} e={e}')
+                        failed[tp] = records.pop(tp)
+                self._commit(records)
+                for tp, tp_records in failed.items():
+                    self.consumer.seek(tp, tp_records[0].offset)
+                if failed:
+                    self._stop_event.wait(retry_wait_secs)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _check_manual_commit(self):
+        if self.auto_commit:
+            msg = 'batch consuming requires auto_commit=False'
+            raise RuntimeError(msg)
+
+    @staticmethod
+    def _decode(record: ConsumerRecord, utf8_decode: bool):
+        return record.value.decode('utf8') if utf8_decode else record.value
+
+    # 提交每个partition最后一条的下一个offset
+    # 处理期间发生rebalance(如处理超过max_poll_interval)时提交失败，partition已分配给其他消费者，由其重新消费，继续读取
+    def _commit(self, records: Dict[TopicPartition, List[ConsumerRecord]]):
+        offsets = {tp: OffsetAndMetadata(tp_records[-1].offset + 1, None)
+                   for tp, tp_records in records.items() if tp_records}
+        if not offsets:
+            return
+        try:
+            self.consumer.commit(offsets=offsets)
+        except CommitFailedError as e:
+            logger.warning(f'commit fail offsets={offsets} e={e}')
+
     def close(self):
         self.consumer.close()
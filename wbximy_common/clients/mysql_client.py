@@ -2,29 +2,42 @@
 
 import time
 import logging
-from datetime import datetime, timedelta
 from threading import Lock
-from typing import Optional, Generator, TypeVar, Dict
+from typing import Optional, Generator, TypeVar, Dict, List
 import pymysql
 from dbutils.steady_db import SteadyDBConnection, SteadyDBCursor
 from dbutils.pooled_db import PooledDB
 from dbutils.persistent_db import PersistentDB
+from wbximy_common.clients.sql_stats import SQLStats
 from wbximy_common.clients.tunnel import TunnelMixin
+from wbximy_common.libs.rate_limiter import TokenBucket
 
 logger = logging.getLogger(__name__)
 DBType = TypeVar('DBType', PersistentDB, PooledDB)
 
 
 class Connection:
-    def __init__(self, conn, transaction=False):
+    def __init__(
+            self,
+            conn,
+            transaction=False,
+            cursor_class=None,  # None表示使用连接默认的cursor_class
+            stats: Optional[SQLStats] = None,  # 按SQL指纹统计调用
+            server: str = '',  # 统计时区分实例 host:port
+            slow_query_secs: float = 5.0,
+    ):
         self.conn: SteadyDBConnection = conn
         self.cursor: Optional[SteadyDBCursor] = None
         self.transaction = transaction
+        self.cursor_class = cursor_class
+        self.stats = stats
+        self.server = server
+        self.slow_query_secs = slow_query_secs
 
     def __enter__(self):
         if self.transaction:
             self.conn.begin()
-        self.cursor = self.conn.cursor()
+        self.cursor = self.conn.cursor(self.cursor_class) if self.cursor_class else self.conn.cursor()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -32,19 +45,30 @@ class Connection:
         if self.transaction:
             self.conn.commit()
 
-    def execute(self, sql, args):
+    # stats_sql: 统计时代替sql计算指纹，如值直接拼接在语句中的批量写入可以传入对应的模板
+    def execute(self, sql, args, stats_sql: str = None):
         before_exec_time = time.time()
         logger.debug('conn=%s sql=%s args=%s', id(self.conn), sql, args)
         try:
             ret = self.cursor.execute(sql, args)
         except Exception as e:
             logger.warning('error sql=%s, args=%s e=%s', sql, args, e)
+            if self.stats is not None:
+                self.stats.record(self.server, stats_sql or sql, time.time() - before_exec_time, error=True)
             raise e
         exec_time = time.time() - before_exec_time
-        if exec_time > 5:
+        if self.stats is not None:
+            # SSCursor的rowcount在读完之前无意义(-1)
+            self.stats.record(self.server, stats_sql or sql, exec_time, rows=ret if 0 <= ret < 2 ** 63 else 0)
+        if exec_time > self.slow_query_secs:
             logger.warning('slow query sql=%s args=%s cost=%.2f', sql, args, exec_time)
         return ret
 
+    # 流式读取(SSCursor)中途放弃时调用：解除cursor与连接的关联，避免cursor.close()把剩余结果全部读完
+    # 连接随后在__del__中关闭，服务端停止发送，所以只能用于独立连接
+    def discard_unbuffered(self):
+        self.cursor.connection = None
+
     def __del__(self):
         self.conn.close()
 
@@ -53,6 +77,7 @@ class MySQLClient(TunnelMixin):
 
     _conn_pool_cache: Dict[str, DBType] = dict()  # 全局连接池
     _conn_pool_cache_lock = Lock()
+    _sql_stats = SQLStats()  # 全局SQL统计 按host:port和SQL指纹聚合
 
     def __init__(
             self,
@@ -66,7 +91,14 @@ class MySQLClient(TunnelMixin):
             can_share: bool = True,  # using_persistent_db=True 当host/port 一致时 生效
             max_connections: int = 4,  # PooledDB有效，最大连接数
             max_write_per_minute: int = -1,  # -1为不限制 每分钟写入(insert/update)速度控制
+            max_write_per_second: float = -1,  # -1为不限制 每秒写入速度控制 优先于max_write_per_minute
+            write_burst: float = None,  # 写入速度控制允许的突发量 默认为1秒的写入量
+            write_limiter: Optional[TokenBucket] = None,  # 共享的限速器 如RedisTokenBucket 优先于以上配置
             auto_limit: bool = True,  # SQL语句是否补全limit
+            stream_fetch_size: int = 1000,  # select_many(stream=True) 每次fetchmany的行数
+            stream_write_timeout: int = 600,  # 流式读取时的net_write_timeout 防止消费慢时服务端断开
+            slow_query_secs: float = 5.0,  # 超过该耗时的SQL打印warning
+            collect_sql_stats: bool = True,  # 是否记录到全局SQL统计 见get_sql_stats
     ):
         super().__init__()
         self.host, self.port, self.tunnel = host, port, tunnel
@@ -78,10 +110,16 @@ class MySQLClient(TunnelMixin):
         self._password: str = password
         self._conn_pool: Optional[DBType] = None
         self._max_connections = max_connections
-        self._cur_write_minute: datetime = datetime.now()  # 速度控制，当前写入时间 分钟有效
-        self._cur_write_count: int = 0  # 速度控制，当前写入时间下的计数 insert+update
-        self._max_write_per_minute = max_write_per_minute
+        self._write_limiter: Optional[TokenBucket] = write_limiter  # 速度控制 insert+update
+        if self._write_limiter is None and max_write_per_second > 0:
+            self._write_limiter = TokenBucket(rate=max_write_per_second, burst=write_burst)
+        elif self._write_limiter is None and max_write_per_minute > 0:
+            self._write_limiter = TokenBucket(rate=max_write_per_minute / 60, burst=write_burst)
         self._auto_limit = auto_limit
+        self._stream_fetch_size = stream_fetch_size
+        self._stream_write_timeout = stream_write_timeout
+        self._slow_query_secs = slow_query_secs
+        self._collect_sql_stats = collect_sql_stats
 
         if not self._lazy_init:
             self._init_conn_pool()
@@ -140,17 +178,35 @@ class MySQLClient(TunnelMixin):
         if not self._conn_pool:
             self._init_conn_pool()
         conn = self._conn_pool.connection()
-        return Connection(conn, transaction)
+        return self._wrap_conn(conn, transaction)
+
+    def _wrap_conn(self, conn, transaction=False, cursor_class=None) -> Connection:
+        return Connection(
+            conn,
+            transaction=transaction,
+            cursor_class=cursor_class,
+            stats=self._sql_stats if self._collect_sql_stats else None,
+            server='{}:{}'.format(self.host, self.port),
+            slow_query_secs=self._slow_query_secs,
+        )
+
+    # SQL统计快照，按总耗时倒序，每项包含 server fingerprint calls rows errors total_secs avg_secs p50/p95/p99_secs max_secs
+    @classmethod
+    def get_sql_stats(cls, top: int = None) -> List[Dict]:
+        return cls._sql_stats.snapshot(top=top)
+
+    @classmethod
+    def reset_sql_stats(cls):
+        cls._sql_stats.reset()
 
     def _do_write_check(self, incr):
-        if self._max_write_per_minute >= 0 and incr > 0:
-            if self._cur_write_minute + timedelta(minutes=1) < datetime.now():
-                self._cur_write_minute = datetime.now()
-                self._cur_write_count = 0
-            if self._cur_write_count >= self._max_write_per_minute:
-                logger.warning('reach max write per minute %s, sleep for...', self._max_write_per_minute)
-                time.sleep(1.0)
-            self._cur_write_count += incr
+        if self._write_limiter is not None and incr > 0:
+            self._write_limiter.acquire(incr)
+
+    # 写入后按实际行数补扣令牌，不等待，透支的部分由后续写入等待
+    def _charge_write(self, incr):
+        if self._write_limiter is not None and incr > 0:
+            self._write_limiter.reserve(incr)
 
     def select(self, sql: str, args=None) -> Optional[dict]:
         with self.get_conn() as conn:
@@ -161,7 +217,11 @@ class MySQLClient(TunnelMixin):
             result = conn.cursor.fetchone()
             return result
 
-    def select_many(self, sql: str, args=None) -> Generator[dict, None, None]:
+    # stream=True 时基于SSDictCursor流式读取，不补全limit，内存占用与结果集大小无关
+    def select_many(self, sql: str, args=None, stream=False, fetch_size=None) -> Generator[dict, None, None]:
+        if stream:
+            yield from self._select_stream(sql, args, fetch_size=fetch_size or self._stream_fetch_size)
+            return
         with self.get_conn() as conn:
             if self._auto_limit and ' limit ' not in sql:
                 sql = sql + ' limit 40000'
@@ -170,17 +230,53 @@ class MySQLClient(TunnelMixin):
             for result in conn.cursor.fetchall():
                 yield result
 
-    # 返回变更的行数
+    # 服务端游标会独占连接直到结果读完，为避免和同线程的其他查询冲突，流式读取总是使用一个独立的新连接
+    def _select_stream(self, sql: str, args, fetch_size: int) -> Generator[dict, None, None]:
+        raw_conn = pymysql.connect(
+            host=self.host,
+            port=self.port,
+            user=self._user,
+            password=self._password,
+            charset='UTF8MB4',
+            autocommit=True,
+            cursorclass=pymysql.cursors.SSDictCursor,
+        )
+        finished, rows = False, 0
+        with self._wrap_conn(raw_conn) as conn:
+            try:
+                conn.execute('set session net_write_timeout=%s', (self._stream_write_timeout, ))
+                conn.execute(sql, args)
+                while True:
+                    results = conn.cursor.fetchmany(fetch_size)
+                    if not results:
+                        break
+                    rows += len(results)
+                    yield from results
+                finished = True
+            finally:
+                if not finished:
+                    conn.discard_unbuffered()
+                if conn.stats is not None:
+                    conn.stats.add_rows(conn.server, sql, rows)
+
+    # 返回变更的行数 写入前先获取1个令牌，超出的行数在写入后补扣
     def execute(self, sql: str, args=None) -> int:
+        self._do_write_check(incr=1)
         with self.get_conn() as conn:
             rows_affected = conn.execute(sql, args)
-            self._do_write_check(incr=rows_affected)
-            return rows_affected
+        self._charge_write(incr=rows_affected - 1)
+        return rows_affected
+
+    # 批量写入 写入前按行数预先获取令牌，避免一次写入大量数据后才开始限速，返回变更的行数
+    # stats_sql见Connection.execute
+    def execute_bulk(self, sql: str, row_count: int, args=None, stats_sql: str = None) -> int:
+        self._do_write_check(incr=row_count)
+        with self.get_conn() as conn:
+            return conn.execute(sql, args, stats_sql=stats_sql)
 
     # 返回生效的row_id
     def insert(self, sql: str, args=None) -> int:
+        self._do_write_check(incr=1)
         with self.get_conn() as conn:
             conn.execute(sql, args)
-            if conn.cursor.lastrowid > 0:
-                self._do_write_check(incr=1)
             return conn.cursor.lastrowid
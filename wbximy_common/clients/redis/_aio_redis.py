@@ -0,0 +1,65 @@
+# encoding=utf8
+
+import asyncio
+import logging
+from threading import Lock
+from typing import Dict, Tuple
+import redis.asyncio
+from wbximy_common.clients.tunnel import TunnelMixin
+
+logger = logging.getLogger(__name__)
+
+
+# Redis的asyncio版本，增加TunneledClient功能
+class AioRedis(redis.asyncio.Redis, TunnelMixin):
+    _shared_cache: Dict[Tuple, 'AioRedis'] = dict()  # (host, port, db, password, tunnel, loop) -> AioRedis
+    _shared_cache_lock = Lock()
+
+    def __init__(
+            self,
+            host='localhost',
+            port=6379,
+            password=None,
+            db=0,
+            tunnel=None,
+            max_connections: int = None,  # 连接池最大连接数 None为不限制
+            health_check_interval: int = 0,  # 连接空闲超过该秒数 使用前先PING检查 默认0为不检查
+            **kwargs,
+    ):
+        self.host, self.port, self.tunnel = host, port, tunnel
+        self.mix()
+        super().__init__(
+            host=self.host,
+            port=self.port,
+            password=password,
+            db=db,
+            decode_responses=True,
+            max_connections=max_connections,
+            health_check_interval=health_check_interval,
+            **kwargs,
+        )
+
+    # 进程内按 host/port/db/password/tunnel 共享的client，连接绑定event loop，所以按event loop分别共享
+    # 以loop对象而不是id(loop)为key：loop关闭回收后id可能被新的loop复用，拿到绑定在已关闭loop上的client
+    # 在event loop之外创建时共用一个，只能在一个event loop中使用
+    @classmethod
+    def get_shared(cls, host='localhost', port=6379, password=None, db=0, tunnel=None, **kwargs) -> 'AioRedis':
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        key = (host, port, db, password, tunnel, loop)
+        with cls._shared_cache_lock:
+            client = cls._shared_cache.get(key)
+            if client is None:
+                cls._purge_closed_loops()
+                client = cls(host=host, port=port, password=password, db=db, tunnel=tunnel, **kwargs)
+                cls._shared_cache[key] = client
+                logger.info(f'new shared aio redis client for {host}:{port}/{db}')
+            return client
+
+    # 已关闭的loop上的client无法再使用，直接丢弃(同时释放对loop的引用)
+    @classmethod
+    def _purge_closed_loops(cls):
+        for key in [k for k in cls._shared_cache if k[-1] is not None and k[-1].is_closed()]:
+            cls._shared_cache.pop(key)
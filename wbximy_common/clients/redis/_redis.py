@@ -1,6 +1,8 @@
 # encoding=utf8
 
 import logging
+from threading import Lock
+from typing import Dict, Tuple, List
 import redis
 from wbximy_common.clients.tunnel import TunnelMixin
 
@@ -9,7 +11,20 @@ logger = logging.getLogger(__name__)
 
 # 增加TunneledClient功能
 class Redis(redis.Redis, TunnelMixin):
-    def __init__(self, host='localhost', port=6379, password=None, db=0, tunnel=None, **kwargs):
+    _shared_cache: Dict[Tuple, 'Redis'] = dict()  # 全局共享的client (host, port, db, password, tunnel) -> Redis
+    _shared_cache_lock = Lock()
+
+    def __init__(
+            self,
+            host='localhost',
+            port=6379,
+            password=None,
+            db=0,
+            tunnel=None,
+            max_connections: int = None,  # 连接池最大连接数 None为不限制
+            health_check_interval: int = 0,  # 连接空闲超过该秒数 使用前先PING检查 默认0为不检查
+            **kwargs,
+    ):
         self.host, self.port, self.tunnel = host, port, tunnel
         self.mix()
         super().__init__(
@@ -18,5 +33,41 @@ class Redis(redis.Redis, TunnelMixin):
             password=password,
             db=db,
             decode_responses=True,
+            max_connections=max_connections,
+            health_check_interval=health_check_interval,
             **kwargs,
         )
+
+    # 进程内按 host/port/db/password/tunnel 共享的client，共用一个连接池；其他参数以第一次创建时为准
+    @classmethod
+    def get_shared(cls, host='localhost', port=6379, password=None, db=0, tunnel=None, **kwargs) -> 'Redis':
+        key = (host, port, db, password, tunnel)
+        with cls._shared_cache_lock:
+            client = cls._shared_cache.get(key)
+            if client is None:
+                client = cls(host=host, port=port, password=password, db=db, tunnel=tunnel, **kwargs)
+                cls._shared_cache[key] = client
+                logger.info(f'new shared redis client for {host}:{port}/{db}')
+            return client
+
+    # 连接池使用情况 created/in_use/available来自ConnectionPool的私有属性，不可用(如BlockingConnectionPool)时为None
+    def pool_stats(self) -> Dict:
+        pool = self.connection_pool
+        in_use = getattr(pool, '_in_use_connections', None)
+        available = getattr(pool, '_available_connections', None)
+        return {
+            'host': self.host,
+            'port': self.port,
+            'db': pool.connection_kwargs.get('db'),
+            'max_connections': getattr(pool, 'max_connections', None),
+            'created': getattr(pool, '_created_connections', None),
+            'in_use': None if in_use is None else len(in_use),
+            'available': None if available is None else len(available),
+        }
+
+    # 全部共享client的连接池使用情况
+    @classmethod
+    def shared_pool_stats(cls) -> List[Dict]:
+        with cls._shared_cache_lock:
+            clients = list(cls._shared_cache.values())
+        return [client.pool_stats() for client in clients]
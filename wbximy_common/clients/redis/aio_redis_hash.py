@@ -0,0 +1,41 @@
+# encoding=utf8
+
+import logging
+from datetime import datetime
+from typing import Type, List, Dict, AsyncGenerator, Tuple
+from wbximy_common.clients.redis._aio_redis import AioRedis
+from wbximy_common.clients.redis.redis_hash import _dumps, _loads
+
+logger = logging.getLogger(__name__)
+
+
+# RedisHash的asyncio版本，只接受datetime和int
+class AioRedisHash(object):
+    def __init__(self, name, value_type=int, shared=True, **kwargs):
+        assert value_type in (int, datetime)
+        self.redis = AioRedis.get_shared(**kwargs) if shared else AioRedis(**kwargs)  # shared 见AioRedis.get_shared
+        self.name: str = name
+        self.value_type: Type = value_type
+
+    async def get(self, key):
+        return _loads(await self.redis.hget(self.name, key=key), self.value_type)
+
+    async def set(self, key, value):
+        return await self.redis.hset(self.name, key=key, value=_dumps(value, self.value_type))
+
+    async def get_many(self, keys: List) -> List:
+        if not keys:
+            return []
+        return [_loads(o, self.value_type) for o in await self.redis.hmget(self.name, keys)]
+
+    async def set_many(self, mapping: Dict):
+        if not mapping:
+            return 0
+        return await self.redis.hset(self.name, mapping={k: _dumps(v, self.value_type) for k, v in mapping.items()})
+
+    async def items(self, count: int = 1000) -> AsyncGenerator[Tuple[str, object], None]:
+        async for key, o in self.redis.hscan_iter(self.name, count=count):
+            yield key, _loads(o, self.value_type)
+
+    async def length(self) -> int:
+        return await self.redis.hlen(self.name)
@@ -0,0 +1,75 @@
+# encoding=utf8
+
+import time
+import asyncio
+import logging
+from typing import List, Tuple
+from wbximy_common.clients.redis._aio_redis import AioRedis
+from wbximy_common.clients.redis.redis_queue import RedisQueue, _max_length, _pop_timeout, _push_args
+
+logger = logging.getLogger(__name__)
+
+
+# RedisQueue的asyncio版本，语义一致：时效性任务优先，超过队列长度时等待消费(不占用线程)
+class AioRedisQueue(object):
+    def __init__(self, name, max_length=1024, shared=True, **kwargs):
+        self.name: str = name
+        self.max_length: int = max_length
+        self.redis = AioRedis.get_shared(**kwargs) if shared else AioRedis(**kwargs)  # shared 见AioRedis.get_shared
+        self._score_key: str = f'{name}:score'
+        self._push_script = self.redis.register_script(RedisQueue._PUSH_SCRIPT)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.pop(wait=-1)
+
+    async def pop(self, wait=0):
+        data = await self.redis.bzpopmin(self.name, timeout=_pop_timeout(wait))
+        return data and data[1]
+
+    # 一次ZPOPMIN取出至多count个；队列为空时按wait阻塞等待第一个(含义同pop)
+    async def pop_many(self, count: int, wait=0) -> List[str]:
+        values = [value for value, _ in await self.redis.zpopmin(self.name, count)]
+        if values:
+            return values
+        value = await self.pop(wait=wait)
+        if value is None:
+            return []
+        return [value] + ([v for v, _ in await self.redis.zpopmin(self.name, count - 1)] if count > 1 else [])
+
+    # 见RedisQueue.push：至多等待wait秒后照常写入，返回新增的个数
+    async def push(self, value: str, realtime=False, wait=5.0) -> int:
+        return (await self._push([value], realtime, wait, force=True))[1]
+
+    # 见RedisQueue.push_many
+    async def push_many(self, values: List[str], realtime=False, wait=-1) -> int:
+        return (await self._push(values, realtime, wait, force=False))[0]
+
+    # 见RedisQueue._push
+    async def _push(self, values: List[str], realtime: bool, wait, force: bool) -> Tuple[int, int]:
+        assert all(isinstance(value, str) for value in values)
+        max_length = _max_length(self.max_length, realtime)
+        keys = [self.name, self._score_key]
+        pending, pushed, added = values, 0, 0
+        deadline, backoff = time.monotonic() + wait, 0.01
+        while pending:
+            batch = pending[:max_length]
+            consumed, n, round_added = await self._push_script(keys=keys, args=_push_args(batch, max_length, realtime))
+            pending, pushed, added = pending[consumed:], pushed + n, added + round_added
+            if consumed == len(batch):
+                continue
+            remain = deadline - time.monotonic() if wait >= 0 else float('inf')
+            if remain <= 0 and force:
+                logger.warning(f'{self.name} length greater than {max_length} after {wait}s, push anyway')
+                args = _push_args(pending, max_length, realtime, force=True)
+                _, n, round_added = await self._push_script(keys=keys, args=args)
+                pushed, added = pushed + n, added + round_added
+                break
+            if remain <= 0:
+                msg = f'{self.name} full, max_length={max_length} pushed={pushed} pending={len(pending)}'
+                raise RuntimeError(f'{msg} after {wait}s')
+            backoff = 0.01 if consumed > 0 else min(backoff * 2, 0.2)
+            await asyncio.sleep(min(backoff, remain))
+        return pushed, added
@@ -0,0 +1,75 @@
+# encoding=utf8
+
+import math
+import logging
+from hashlib import blake2b
+from typing import List, Iterable, Union
+from wbximy_common.clients.redis._redis import Redis
+
+logger = logging.getLogger(__name__)
+
+
+# 布隆过滤器 位数组存放在redis string中，用于大规模去重(如url、信用代码)
+# contains为False时一定不存在；为True时有error_rate的概率误判(实际不存在)
+# 位数组大小 m = -n*ln(p)/ln(2)^2，哈希函数个数 k = m/n*ln(2)，redis string最大2^32位，1亿条/0.1%约需180MB
+# 每条数据的k个位通过一条BITFIELD命令读写，批量操作通过pipeline一次往返
+class RedisBloomFilter(object):
+    MAX_BITS = 2 ** 32
+    _CHUNK = 1000  # 每个pipeline的条数
+
+    def __init__(
+            self,
+            name: str,
+            capacity: int,  # 预计的数据条数 超过后误判率上升
+            error_rate: float = 0.001,  # 误判率
+            shared: bool = True,  # 共享同一redis实例的连接池 见Redis.get_shared
+            **kwargs,
+    ):
+        assert capacity > 0 and 0 < error_rate < 1
+        self.redis = Redis.get_shared(**kwargs) if shared else Redis(**kwargs)
+        self.name: str = name
+        self.capacity: int = capacity
+        self.error_rate: float = error_rate
+        self.num_bits: int = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes: int = max(1, round(self.num_bits / capacity * math.log(2)))
+        if self.num_bits > self.MAX_BITS:
+            msg = f'bloom filter too large bits={self.num_bits} capacity={capacity} error_rate={error_rate}'
+            raise RuntimeError(msg)
+
+    # double hashing: 由一次blake2b得到的两个64位值生成k个位置
+    def _offsets(self, value: Union[str, bytes]) -> List[int]:
+        data = value.encode('utf8') if isinstance(value, str) else value
+        digest = blake2b(data, digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def _bitfield(self, values: List, op: str) -> List[List[int]]:
+        results = []
+        for i in range(0, len(values), self._CHUNK):
+            pipe = self.redis.pipeline(transaction=False)
+            for value in values[i: i + self._CHUNK]:
+                args = []
+                for offset in self._offsets(value):
+                    args += ['SET', 'u1', offset, 1] if op == 'SET' else ['GET', 'u1', offset]
+                pipe.execute_command('BITFIELD', self.name, *args)
+            results += pipe.execute()
+        return results
+
+    # 返回与values一一对应的是否为新增(之前不存在)，同一批中重复的值只有第一个为True
+    def add_many(self, values: Iterable[Union[str, bytes]]) -> List[bool]:
+        return [not all(bits) for bits in self._bitfield(list(values), 'SET')]
+
+    def contains_many(self, values: Iterable[Union[str, bytes]]) -> List[bool]:
+        return [all(bits) for bits in self._bitfield(list(values), 'GET')]
+
+    def add(self, value: Union[str, bytes]) -> bool:
+        return self.add_many([value])[0]
+
+    def contains(self, value: Union[str, bytes]) -> bool:
+        return self.contains_many([value])[0]
+
+    def __contains__(self, value):
+        return self.contains(value)
+
+    def clear(self):
+        self.redis.delete(self.name)
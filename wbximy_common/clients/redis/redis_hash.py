@@ -2,34 +2,206 @@
 
 from datetime import datetime
 import logging
-from typing import Type
+import threading
+import redis
+from typing import Type, List, Dict, Generator, Tuple, Optional
 from wbximy_common.clients.redis._redis import Redis
+from wbximy_common.libs.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
 
+def _dumps(value, value_type: Type) -> str:
+    assert isinstance(value, value_type)
+    if isinstance(value, datetime):
+        value = value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+# fromisoformat 比 strptime 快一个数量级，可以解析 '%Y-%m-%d %H:%M:%S'
+def _loads(o, value_type: Type):
+    if o is None:
+        return o
+    if value_type == datetime:
+        return datetime.fromisoformat(o)
+    return value_type(o)
+
+
 # UPDATE@20240816
 # 只接受datetime和str
+# near_cache_ttl>0 时开启本地缓存(near cache)：get/get_many优先读本地，最多延迟near_cache_ttl秒看到其他进程的修改
+# 同时尝试通过 CLIENT TRACKING BCAST 订阅该hash的修改通知(redis>=6)，收到通知后立即清空本地缓存；不支持时只依赖TTL
+# 本进程的写入通过开启tracking(NOLOOP)的连接执行，不会通知自己，写入后直接更新本地缓存
+# 开启后额外占用两个连接(接收通知和写入)，连接断开重连时自动重新开启tracking，不再使用时调用close
 class RedisHash(object):
-    def __init__(self, name, value_type=int, **kwargs):
+    INVALIDATE_CHANNEL = '__redis__:invalidate'
+
+    def __init__(
+            self,
+            name,
+            value_type=int,
+            shared=True,
+            near_cache_ttl: float = 0,  # 本地缓存的TTL 0为不开启
+            near_cache_max_entries: int = 10000,
+            **kwargs,
+    ):
         assert value_type in (int, datetime)
-        self.redis = Redis(**kwargs)
+        self.redis = Redis.get_shared(**kwargs) if shared else Redis(**kwargs)  # shared 见Redis.get_shared
         self.name: str = name
         self.value_type: Type = value_type
+        self.near_cache: Optional[TTLCache] = None
+        self._write_redis: redis.Redis = self.redis  # 开启tracking时为单独的写入连接
+        self._pubsub = None
+        self._listener_id = None  # 接收通知的连接的client id 重连后改变
+        self._listener: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        if near_cache_ttl > 0:
+            self.near_cache = TTLCache(max_entries=near_cache_max_entries, ttl=near_cache_ttl)
+            self._start_tracking()
+
+    # 接收通知和写入各使用一个单独的连接池，通过redis_connect_func在每次(重新)连接时执行初始化
+    def _start_tracking(self):
+        pool = self.redis.connection_pool
+        try:
+            kwargs = pool.connection_kwargs | {'redis_connect_func': self._on_listener_connect}
+            listener_pool = redis.ConnectionPool(connection_class=pool.connection_class, **kwargs)
+            self._pubsub = redis.Redis(connection_pool=listener_pool).pubsub()
+            self._pubsub.subscribe(self.INVALIDATE_CHANNEL)
+            # 单个连接，避免多个tracking连接重复通知
+            kwargs = pool.connection_kwargs | {'redis_connect_func': self._on_writer_connect}
+            writer_pool = redis.BlockingConnectionPool(
+                max_connections=1, timeout=None, connection_class=pool.connection_class, **kwargs)
+            self._write_redis = redis.Redis(connection_pool=writer_pool)
+            self._write_redis.ping()
+        except Exception as e:
+            logger.warning(f'{self.name} client tracking not available, near cache relies on ttl. e={e}')
+            self._close_tracking()
+            return
+        self._listener = threading.Thread(target=self._listen, name='redis_hash_invalidate', daemon=True)
+        self._listener.start()
+
+    # 接收通知的连接：记录client id，写入连接的tracking重定向到新的id；重连期间可能错过通知，清空本地缓存
+    # 在订阅(pubsub重连后的重新订阅)之前执行
+    def _on_listener_connect(self, conn):
+        conn.on_connect()
+        conn.send_command('CLIENT', 'ID')
+        self._listener_id = conn.read_response()
+        if self._write_redis is not self.redis:
+            writer_pool = self._write_redis.connection_pool
+            writer_conn = writer_pool.get_connection('CLIENT')
+            try:
+                self._enable_tracking(writer_conn)
+            finally:
+                writer_pool.release(writer_conn)
+        if self.near_cache is not None:
+            self.near_cache.clear()
+
+    def _on_writer_connect(self, conn):
+        conn.on_connect()
+        self._enable_tracking(conn)
+
+    # BCAST模式下开启tracking的连接无需读取通知，所有前缀匹配的key被修改都会通知到接收连接
+    # 重复开启时前缀会冲突，先关闭
+    def _enable_tracking(self, conn):
+        conn.send_command('CLIENT', 'TRACKING', 'OFF')
+        conn.read_response()
+        conn.send_command(
+            'CLIENT', 'TRACKING', 'ON', 'REDIRECT', self._listener_id, 'BCAST', 'PREFIX', self.name, 'NOLOOP')
+        conn.read_response()
+
+    def _listen(self):
+        while not self._stop_event.is_set():
+            try:
+                message = self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except Exception as e:
+                # 下一次读取时重连，见_on_listener_connect
+                logger.warning(f'{self.name} invalidate listener e={e}, reconnect')
+                self.near_cache.clear()
+                self._stop_event.wait(1.0)
+                continue
+            if message is None:
+                continue
+            keys = message['data']  # None表示flushdb等，全部失效
+            if keys is None or self.name in (keys if isinstance(keys, list) else [keys]):
+                self.near_cache.clear()
+
+    def _close_tracking(self):
+        if self._write_redis is not self.redis:
+            self._write_redis.connection_pool.disconnect()
+            self._write_redis = self.redis
+        if self._pubsub is not None:
+            self._pubsub.close()
+            self._pubsub.connection_pool.disconnect()
+            self._pubsub = None
+
+    def close(self):
+        self._stop_event.set()
+        if self._listener is not None:
+            self._listener.join()
+            self._listener = None
+        self._close_tracking()
 
     def get(self, key):
-        o = self.redis.hget(self.name, key=key)
-        if o is None:
-            return o
-        if self.value_type == datetime:
-            o = datetime.strptime(o, '%Y-%m-%d %H:%M:%S')
-        return o
+        if self.near_cache is None:
+            return _loads(self.redis.hget(self.name, key=key), self.value_type)
+        hit, value = self.near_cache.get(key)
+        if hit:
+            return value
+        version = self.near_cache.version()
+        value = _loads(self.redis.hget(self.name, key=key), self.value_type)
+        self.near_cache.set(key, value, version=version)
+        return value
 
+    # 写入后更新本地缓存；期间收到通知(其他进程的修改)时不更新
     def set(self, key, value):
-        assert isinstance(value, self.value_type)
-        if isinstance(value, datetime):
-            value = value.strftime('%Y-%m-%d %H:%M:%S')
-        return self.redis.hset(self.name, key=key, value=value)
+        o = _dumps(value, self.value_type)
+        if self.near_cache is None:
+            return self.redis.hset(self.name, key=key, value=o)
+        self.near_cache.invalidate(key)
+        version = self.near_cache.version()
+        ret = self._write_redis.hset(self.name, key=key, value=o)
+        self.near_cache.set(key, _loads(o, self.value_type), version=version)
+        return ret
+
+    # HMGET 一次往返读取多个key，返回与keys一一对应的结果，不存在为None
+    def get_many(self, keys: List) -> List:
+        if not keys:
+            return []
+        if self.near_cache is None:
+            return [_loads(o, self.value_type) for o in self.redis.hmget(self.name, keys)]
+        found, missing = dict(), []
+        for key in keys:
+            hit, value = self.near_cache.get(key)
+            if hit:
+                found[key] = value
+            else:
+                missing.append(key)
+        if missing:
+            version = self.near_cache.version()
+            for key, o in zip(missing, self.redis.hmget(self.name, missing)):
+                found[key] = _loads(o, self.value_type)
+                self.near_cache.set(key, found[key], version=version)
+        return [found[key] for key in keys]
+
+    # HSET mapping 一次往返写入多个key
+    def set_many(self, mapping: Dict):
+        if not mapping:
+            return 0
+        mapping = {k: _dumps(v, self.value_type) for k, v in mapping.items()}
+        if self.near_cache is None:
+            return self.redis.hset(self.name, mapping=mapping)
+        for key in mapping:
+            self.near_cache.invalidate(key)
+        version = self.near_cache.version()
+        ret = self._write_redis.hset(self.name, mapping=mapping)
+        for key, o in mapping.items():
+            self.near_cache.set(key, _loads(o, self.value_type), version=version)
+        return ret
+
+    # HSCAN 分批遍历全部 (key, value)，不经过本地缓存
+    def items(self, count: int = 1000) -> Generator[Tuple[str, object], None, None]:
+        for key, o in self.redis.hscan_iter(self.name, count=count):
+            yield key, _loads(o, self.value_type)
 
     def __len__(self):
         return self.redis.hlen(self.name)
@@ -0,0 +1,152 @@
+# encoding=utf8
+
+import os
+import uuid
+import socket
+import logging
+import threading
+from typing import Set, Optional
+from wbximy_common.clients.redis._redis import Redis
+from wbximy_common.clients.redis.redis_hash import RedisHash, _dumps
+
+logger = logging.getLogger(__name__)
+
+
+# 基于redis的可过期租约，用于多进程/多机之间分配资源(如分表)
+# 租约key为 {name}:{resource}，值为owner，持有者需在ttl内续约，否则视为持有者已死亡，其他进程可以抢占
+# 已完成的资源记录在集合 {name}:done 中，集合默认一直保留(同一name再次运行前需reset_done)，设置done_ttl时自动过期
+class RedisLease(object):
+    _RENEW_SCRIPT = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+'''
+    _RELEASE_SCRIPT = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    if ARGV[2] ~= '' then
+        redis.call('SADD', KEYS[2], ARGV[2])
+        if tonumber(ARGV[3]) > 0 then
+            redis.call('PEXPIRE', KEYS[2], ARGV[3])
+        end
+    end
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+'''
+    # 仍持有租约时才写入，避免租约已被抢占后旧的持有者覆盖新持有者的进度
+    _HSET_IF_OWNER_SCRIPT = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('HSET', KEYS[2], ARGV[2], ARGV[3])
+    return 1
+end
+return 0
+'''
+
+    def __init__(
+            self,
+            name: str,
+            ttl: float = 30.0,  # 租约有效期 秒
+            owner: str = None,  # 默认为 hostname:pid:随机串
+            done_ttl: float = None,  # {name}:done 最后一次写入后的保留时间 秒 默认一直保留
+            shared: bool = True,  # 共享同一redis实例的连接池 见Redis.get_shared
+            **kwargs,
+    ):
+        self.redis = Redis.get_shared(**kwargs) if shared else Redis(**kwargs)
+        self.name: str = name
+        self.ttl: float = ttl
+        self.done_ttl: Optional[float] = done_ttl
+        self.owner: str = owner or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._held: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._heartbeat_thread = None
+        self._init_scripts()
+
+    def _init_scripts(self):
+        self._renew_script = self.redis.register_script(self._RENEW_SCRIPT)
+        self._release_script = self.redis.register_script(self._RELEASE_SCRIPT)
+        self._hset_if_owner_script = self.redis.register_script(self._HSET_IF_OWNER_SCRIPT)
+
+    def _key(self, resource) -> str:
+        return f'{self.name}:{resource}'
+
+    def acquire(self, resource) -> bool:
+        ok = self.redis.set(self._key(resource), self.owner, nx=True, px=int(self.ttl * 1000))
+        if ok:
+            with self._lock:
+                self._held.add(str(resource))
+            logger.info(f'lease {self._key(resource)} acquired by {self.owner}')
+        return bool(ok)
+
+    def renew(self, resource) -> bool:
+        ok = self._renew_script(keys=[self._key(resource)], args=[self.owner, int(self.ttl * 1000)]) == 1
+        if not ok:
+            with self._lock:
+                self._held.discard(str(resource))
+            logger.warning(f'lease {self._key(resource)} lost by {self.owner}')
+        return ok
+
+    # done=True 时同时记录资源已完成，并刷新done集合的过期时间(设置done_ttl时)
+    def release(self, resource, done=False) -> bool:
+        with self._lock:
+            self._held.discard(str(resource))
+        args = [self.owner, str(resource) if done else '', int((self.done_ttl or 0) * 1000)]
+        return self._release_script(keys=[self._key(resource), f'{self.name}:done'], args=args) == 1
+
+    # 本地记录的持有状态，续约失败后为False；以redis为准的检查见hset_if_owner
+    def is_held(self, resource) -> bool:
+        with self._lock:
+            return str(resource) in self._held
+
+    def held(self) -> Set[str]:
+        with self._lock:
+            return set(self._held)
+
+    def done(self) -> Set[str]:
+        return self.redis.smembers(f'{self.name}:done')
+
+    def reset_done(self):
+        self.redis.delete(f'{self.name}:done')
+
+    # 仍持有resource的租约时 写入hash.key=value，返回是否写入
+    def hset_if_owner(self, resource, hash_: RedisHash, key, value) -> bool:
+        keys = [self._key(resource), hash_.name]
+        ok = self._hset_if_owner_script(keys=keys, args=[self.owner, key, _dumps(value, hash_.value_type)]) == 1
+        if not ok:
+            with self._lock:
+                self._held.discard(str(resource))
+        return ok
+
+    # 后台线程每ttl/3续约一次持有的全部租约
+    def start_heartbeat(self):
+        if self._heartbeat_thread is not None:
+            return
+        self._stop_event.clear()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat, name='lease_heartbeat', daemon=True)
+        self._heartbeat_thread.start()
+
+    def stop_heartbeat(self):
+        if self._heartbeat_thread is None:
+            return
+        self._stop_event.set()
+        self._heartbeat_thread.join()
+        self._heartbeat_thread = None
+
+    def _heartbeat(self):
+        while not self._stop_event.wait(self.ttl / 3):
+            for resource in self.held():
+                try:
+                    self.renew(resource)
+                except Exception as e:
+                    logger.warning(f'lease {self._key(resource)} renew e={e}')
+
+    def __enter__(self):
+        self.start_heartbeat()
+        return self
+
+    # 退出时释放全部租约
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop_heartbeat()
+        for resource in self.held():
+            self.release(resource)
@@ -2,22 +2,120 @@
 
 import time
 import logging
+from typing import List, Optional, Tuple
 from wbximy_common.clients.redis._redis import Redis
+from wbximy_common.clients.redis.redis_bloom import RedisBloomFilter
 
 logger = logging.getLogger(__name__)
 
 
+# 时效性任务额外10%的长度
+def _max_length(max_length: int, realtime: bool) -> int:
+    return int(max_length * 1.1) if realtime else max_length
+
+
+# wait转换为BZPOPMIN的timeout：>0 阻塞至多wait秒 0 阻塞1秒 <0 一直阻塞
+def _pop_timeout(wait) -> float:
+    if wait > 0:
+        return wait
+    elif wait == 0:
+        return 1
+    return 0
+
+
+# _PUSH_SCRIPT的参数 设置bloom_filter时每个值后面跟着它的k个位
+def _push_args(pending: List[str], max_length: int, realtime: bool, force=False,
+               bloom_filter: Optional[RedisBloomFilter] = None) -> List:
+    k = bloom_filter.num_hashes if bloom_filter is not None else 0
+    args = [max_length, int(realtime), int(force), k]
+    for value in pending:
+        args.append(value)
+        if k:
+            args += bloom_filter._offsets(value)
+    return args
+
+
 # UPDATE@20240816
 # queue 基于redis zset
-# 区分时效性任务和普通任务。超过队列长度，阻塞N秒，时效性任务额外的10%长度
+# 区分时效性任务和普通任务。超过队列长度，阻塞等待消费(push至多等待wait秒后照常写入，push_many默认一直等待)，时效性任务额外的10%长度
 # 只接受字符串数据
+# 设置bloom_filter时写入前去重：已经写入过的数据(含误判)不再写入，去重和写入在同一lua脚本中原子完成
 class RedisQueue(object):
-    def __init__(self, name, max_length=1024, **kwargs):
+    # 原子地检查长度、去重并写入，按顺序处理直到处理完或写满剩余容量(force=1时不检查容量)
+    # 返回{处理的个数, 写入的个数, ZADD新增的个数}，去重跳过的也算作已处理
+    # 去重：k>0时检查每个值的k个位，已全部置位则视为重复跳过(队列已满时也跳过)，否则置位后写入；与写入在同一脚本中
+    # 原子完成(test-and-set)，多个写入方同时写入同一个值时只有一个会写入。bloom_filter必须与队列在同一个redis实例
+    # score在服务端生成：取redis TIME(时效性任务提前1e9秒)，且严格大于KEYS[2]中记录的上一次的最大score，
+    # 按微秒递增。批次再大也不会排到下一批之后，跨批次、跨客户端保持先后顺序。脚本内调用TIME需要redis>=5
+    # KEYS: 队列, 记录上一次score的hash(字段为realtime), bloom_filter(k>0时)
+    # ARGV: max_length, realtime, force, k, member1, [k个位], member2, [k个位] ...
+    # ZADD分段调用，避免unpack超过lua栈的限制；score格式化为字符串，避免lua数字转换丢失精度
+    _PUSH_SCRIPT = '''
+local k = tonumber(ARGV[4])
+local total = (#ARGV - 4) / (k + 1)
+local space = total
+if ARGV[3] == '0' then
+    space = tonumber(ARGV[1]) - redis.call('ZCARD', KEYS[1])
+end
+local members, consumed = {}, 0
+while consumed < total do
+    local pos = 5 + consumed * (k + 1)
+    local dup = k > 0
+    for h = 1, k do
+        if redis.call('GETBIT', KEYS[3], ARGV[pos + h]) == 0 then
+            dup = false
+            break
+        end
+    end
+    if not dup then
+        if #members >= space then
+            break
+        end
+        for h = 1, k do
+            redis.call('SETBIT', KEYS[3], ARGV[pos + h], 1)
+        end
+        members[#members + 1] = ARGV[pos]
+    end
+    consumed = consumed + 1
+end
+local n = #members
+if n == 0 then
+    return {consumed, 0, 0}
+end
+local now = redis.call('TIME')
+local base = tonumber(now[1]) + tonumber(now[2]) / 1000000
+if ARGV[2] == '1' then
+    base = base - 1000000000
+end
+local last = tonumber(redis.call('HGET', KEYS[2], ARGV[2]))
+if last and base <= last then
+    base = last + 0.000001
+end
+local added, i = 0, 0
+while i < n do
+    local j = math.min(i + 1000, n)
+    local args = {}
+    for m = i + 1, j do
+        args[#args + 1] = string.format('%.6f', base + (m - 1) * 0.000001)
+        args[#args + 1] = members[m]
+    end
+    added = added + redis.call('ZADD', KEYS[1], unpack(args))
+    i = j
+end
+redis.call('HSET', KEYS[2], ARGV[2], string.format('%.6f', base + (n - 1) * 0.000001))
+return {consumed, n, added}
+'''
+
+    def __init__(self, name, max_length=1024, shared=True, bloom_filter: Optional[RedisBloomFilter] = None, **kwargs):
         self.name: str = name
         self.max_length: int = max_length
-        self.redis = Redis(**kwargs)
+        self.bloom_filter: Optional[RedisBloomFilter] = bloom_filter
+        self.redis = Redis.get_shared(**kwargs) if shared else Redis(**kwargs)  # shared 见Redis.get_shared
+        self._score_key: str = f'{name}:score'
+        self._push_script = self.redis.register_script(self._PUSH_SCRIPT)
 
-    # The __iter__ method simply returns self. This is needed so that the instance of the class is recognized as an iterator.
+    # The __iter__ method simply returns self.
+    # This is needed so that the instance of the class is recognized as an iterator.
     def __iter__(self):
         return self
 
@@ -26,21 +124,55 @@ class RedisQueue(object):
         return self.pop(wait=-1)
 
     def pop(self, wait=0):
-        if wait > 0:
-            timeout = wait
-        elif wait == 0:
-            timeout = 1
-        else:
-            timeout = 0
-        data = self.redis.bzpopmin(self.name, timeout=timeout)
+        data = self.redis.bzpopmin(self.name, timeout=_pop_timeout(wait))
         return data and data[1]
 
-    def push(self, value: str, realtime=False, wait=5.0):
-        assert isinstance(value, str)
-        length = self.redis.zcard(self.name)
-        max_length = int(self.max_length * 1.1) if realtime else self.max_length
-        if length > max_length:
-            logger.warning(f'sleep for length {length} greater than {max_length}')
-            time.sleep(wait)
-        score = time.time() - 1000000000 if realtime else time.time()
-        return self.redis.zadd(self.name, {value: score})
+    # 一次ZPOPMIN取出至多count个；队列为空时按wait阻塞等待第一个(含义同pop)
+    def pop_many(self, count: int, wait=0) -> List[str]:
+        values = [value for value, _ in self.redis.zpopmin(self.name, count)]
+        if values:
+            return values
+        value = self.pop(wait=wait)
+        if value is None:
+            return []
+        return [value] + ([v for v, _ in self.redis.zpopmin(self.name, count - 1)] if count > 1 else [])
+
+    # 与原来的约定一致：队列已满时至多等待wait秒(<0 一直等待)，仍然已满则照常写入(允许超过max_length)
+    # 返回新增的个数(ZADD的返回值，已在队列中或被bloom_filter过滤时为0)
+    def push(self, value: str, realtime=False, wait=5.0) -> int:
+        return self._push([value], realtime, wait, force=True)[1]
+
+    # 批量写入，长度检查和多值ZADD在一次lua脚本调用中原子完成，每轮只需一次往返
+    # 只写入剩余容量允许的部分，保持先后顺序；队列已满时退避重试直到全部写入，返回写入的个数(去重后)
+    # wait: <0 一直等待 >=0 至多等待wait秒，超时仍未全部写入时抛出RuntimeError(已写入的部分不回滚)
+    def push_many(self, values: List[str], realtime=False, wait=-1) -> int:
+        return self._push(values, realtime, wait, force=False)[0]
+
+    # 返回(写入的个数, 新增的个数) force: 超时后是否仍然写入剩余部分
+    def _push(self, values: List[str], realtime: bool, wait, force: bool) -> Tuple[int, int]:
+        assert all(isinstance(value, str) for value in values)
+        max_length = _max_length(self.max_length, realtime)
+        keys = [self.name, self._score_key] + ([self.bloom_filter.name] if self.bloom_filter is not None else [])
+        pending, pushed, added = values, 0, 0
+        deadline, backoff = time.monotonic() + wait, 0.01
+        while pending:
+            batch = pending[:max_length]
+            args = _push_args(batch, max_length, realtime, bloom_filter=self.bloom_filter)
+            consumed, n, round_added = self._push_script(keys=keys, args=args)
+            pending, pushed, added = pending[consumed:], pushed + n, added + round_added
+            if consumed == len(batch):
+                continue
+            remain = deadline - time.monotonic() if wait >= 0 else float('inf')
+            if remain <= 0 and force:
+                logger.warning(f'{self.name} length greater than {max_length} after {wait}s, push anyway')
+                args = _push_args(pending, max_length, realtime, force=True, bloom_filter=self.bloom_filter)
+                _, n, round_added = self._push_script(keys=keys, args=args)
+                pushed, added = pushed + n, added + round_added
+                break
+            if remain <= 0:
+                msg = f'{self.name} full, max_length={max_length} pushed={pushed} pending={len(pending)}'
+                raise RuntimeError(f'{msg} after {wait}s')
+            # 有进展说明在被消费，尽快重试；否则退避
+            backoff = 0.01 if consumed > 0 else min(backoff * 2, 0.2)
+            time.sleep(min(backoff, remain))
+        return pushed, added
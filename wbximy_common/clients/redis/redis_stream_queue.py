@@ -0,0 +1,150 @@
+# encoding=utf8
+
+import os
+import time
+import socket
+import logging
+from collections import namedtuple, deque
+from typing import List, Dict
+import redis
+from wbximy_common.clients.redis._redis import Redis
+
+logger = logging.getLogger(__name__)
+
+# stream: 所在的stream  id: 消息id  value: 消息内容  用于ack
+StreamMessage = namedtuple('StreamMessage', ['stream', 'id', 'value'])
+
+
+# queue 基于redis stream + consumer group，消息读取后需要ack，未ack的消息超过visibility_timeout后由其他消费者重新领取
+# 与RedisQueue一致区分时效性任务和普通任务：时效性任务写入单独的stream {name}:rt，读取时优先
+# 长度通过 XADD MAXLEN ~ 近似限制，超过后最早的消息被丢弃(包括未消费的)
+# 只接受字符串数据
+class RedisStreamQueue(object):
+    FIELD = 'v'
+
+    def __init__(
+            self,
+            name: str,
+            group: str = 'default',  # 消费组 不同消费组各自消费全部消息
+            consumer: str = None,  # 消费者名称 默认为 hostname:pid
+            max_length: int = 100000,  # 每个stream的近似最大长度
+            visibility_timeout: float = 60.0,  # 读取后超过该秒数未ack的消息可以被重新领取
+            shared: bool = True,  # 共享同一redis实例的连接池 见Redis.get_shared
+            **kwargs,
+    ):
+        self.name: str = name
+        self.rt_name: str = f'{name}:rt'
+        self.group: str = group
+        self.consumer: str = consumer or f'{socket.gethostname()}:{os.getpid()}'
+        self.max_length: int = max_length
+        self.visibility_timeout: float = visibility_timeout
+        self.redis = Redis.get_shared(**kwargs) if shared else Redis(**kwargs)
+        self._last_reclaim_time: float = 0.0
+        self._buffer: deque = deque()  # (读取时间, 消息) 阻塞读取时多读到的消息(COUNT对每个stream分别生效)，下次read优先返回
+        self._create_groups()
+
+    def _create_groups(self):
+        for stream in (self.rt_name, self.name):
+            try:
+                self.redis.xgroup_create(stream, self.group, id='0', mkstream=True)
+            except redis.ResponseError as e:
+                if 'BUSYGROUP' not in str(e):
+                    raise e
+
+    # 返回消息id
+    def push(self, value: str, realtime=False) -> str:
+        assert isinstance(value, str)
+        stream = self.rt_name if realtime else self.name
+        return self.redis.xadd(stream, {self.FIELD: value}, maxlen=self.max_length, approximate=True)
+
+    # pipeline批量写入，返回消息id列表
+    def push_many(self, values: List[str], realtime=False) -> List[str]:
+        assert all(isinstance(value, str) for value in values)
+        stream = self.rt_name if realtime else self.name
+        pipe = self.redis.pipeline(transaction=False)
+        for value in values:
+            pipe.xadd(stream, {self.FIELD: value}, maxlen=self.max_length, approximate=True)
+        return pipe.execute()
+
+    # 读取至多count条消息：先领取超时未ack的消息，再读取新消息，时效性任务优先
+    # wait含义同RedisQueue.pop: >0 阻塞至多wait秒 0 阻塞1秒 <0 一直阻塞
+    def read(self, count: int = 10, wait=0) -> List[StreamMessage]:
+        messages = self._take_buffer(count)
+        if len(messages) >= count:
+            return messages
+        messages += self.reclaim(count - len(messages))
+        for stream in (self.rt_name, self.name):
+            if len(messages) >= count:
+                return messages
+            messages += self._read_group({stream: '>'}, count - len(messages))
+        if messages:
+            return messages
+        if wait > 0:
+            block = int(wait * 1000)
+        elif wait == 0:
+            block = 1000
+        else:
+            block = 0
+        messages = self._read_group({self.rt_name: '>', self.name: '>'}, count, block=block)
+        now = time.monotonic()
+        self._buffer.extend((now, message) for message in messages[count:])
+        return messages[:count]
+
+    # 缓冲的消息在交出前可能已经超过visibility_timeout被其他消费者领取
+    # 交出前XCLAIM(min_idle_time为缓冲的时长)：仍属于自己时才成功，同时刷新空闲时间；已被领取或删除的丢弃
+    def _take_buffer(self, count: int) -> List[StreamMessage]:
+        if not self._buffer:
+            return []
+        items = [self._buffer.popleft() for _ in range(min(count, len(self._buffer)))]
+        now = time.monotonic()
+        pipe = self.redis.pipeline(transaction=False)
+        for read_time, message in items:
+            min_idle_time = int((now - read_time) * 1000)
+            pipe.xclaim(message.stream, self.group, self.consumer, min_idle_time, [message.id], justid=True)
+        messages = [message for (_, message), ids in zip(items, pipe.execute()) if ids]
+        if len(messages) < len(items):
+            logger.warning(f'{self.name} {self.group} dropped {len(items) - len(messages)} buffered messages')
+        return messages
+
+    def _read_group(self, streams: Dict[str, str], count: int, block: int = None) -> List[StreamMessage]:
+        results = self.redis.xreadgroup(self.group, self.consumer, streams, count=count, block=block)
+        return [StreamMessage(stream, mid, fields.get(self.FIELD))
+                for stream, entries in results or [] for mid, fields in entries if fields]
+
+    # 领取本组中超过visibility_timeout未ack的消息，间隔visibility_timeout/4以上才检查一次，force=True时立即检查
+    def reclaim(self, count: int = 10, force=False) -> List[StreamMessage]:
+        now = time.monotonic()
+        if not force and now - self._last_reclaim_time < self.visibility_timeout / 4:
+            return []
+        self._last_reclaim_time = now
+        messages = []
+        for stream in (self.rt_name, self.name):
+            if len(messages) >= count:
+                break
+            ret = self.redis.xautoclaim(
+                stream, self.group, self.consumer,
+                min_idle_time=int(self.visibility_timeout * 1000), start_id='0-0', count=count - len(messages))
+            entries = ret[1]  # [next_start_id, entries, deleted_ids(redis>=7)]
+            messages += [StreamMessage(stream, mid, fields.get(self.FIELD)) for mid, fields in entries if fields]
+        if messages:
+            logger.warning(f'{self.name} {self.group} reclaimed {len(messages)} messages')
+        return messages
+
+    # 确认消息已处理，返回确认的条数
+    def ack(self, messages: List[StreamMessage]) -> int:
+        ids: Dict[str, List[str]] = dict()
+        for message in messages:
+            ids.setdefault(message.stream, []).append(message.id)
+        if not ids:
+            return 0
+        pipe = self.redis.pipeline(transaction=False)
+        for stream, stream_ids in ids.items():
+            pipe.xack(stream, self.group, *stream_ids)
+        return sum(pipe.execute())
+
+    # 本组已读取未ack的消息数
+    def pending(self) -> int:
+        return sum(self.redis.xpending(stream, self.group)['pending'] for stream in (self.rt_name, self.name))
+
+    def __len__(self):
+        return self.redis.xlen(self.rt_name) + self.redis.xlen(self.name)
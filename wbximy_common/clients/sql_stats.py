@@ -0,0 +1,144 @@
+# encoding=utf8
+
+import re
+import bisect
+import logging
+from functools import lru_cache
+from threading import Lock
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_COMMENT_PAT = re.compile(r'/\*.*?\*/|--[^\n]*', re.S)
+_STRING_PAT = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_PARAM_PAT = re.compile(r'%\(\w+\)s|%s')
+_NUMBER_PAT = re.compile(r'\b\d+(?:\.\d+)?(?:e[+-]?\d+)?\b|\bnull\b')
+_IN_PAT = re.compile(r'\bin\s*(?:\(\s*\?(?:\s*,\s*\?)*\s*\)|\?)')
+_VALUES_PAT = re.compile(r'\bvalues\s*(\([?,\s]*\))(?:\s*,\s*\([?,\s]*\))*')
+_SPACE_PAT = re.compile(r'\s+')
+_QUOTE_PAT = re.compile(r'[\'"]')
+_VALUES_HEAD_PAT = re.compile(r'\bvalues \([?,]*\)')
+_IN_TAIL_PAT = re.compile(r'\bin \((?:\?,?)*$')  # 截断在in列表中间
+_MAX_CACHED_SQL = 2048  # 超过该长度的语句不缓存指纹，只取前缀计算
+
+
+# SQL指纹：去掉注释，字面量和参数占位符替换为?，in列表和多行values折叠，用于按语句模式聚合统计
+# 长语句(如拼接了大量值的批量写入)只取前_MAX_CACHED_SQL个字符：截断处未闭合的字符串以及第一组values之后的部分丢弃，以' ...'结尾
+def sql_fingerprint(sql: str) -> str:
+    if len(sql) <= _MAX_CACHED_SQL:
+        return _cached_fingerprint(sql)
+    s = _STRING_PAT.sub('?', _COMMENT_PAT.sub(' ', sql[:_MAX_CACHED_SQL]))
+    s = _fingerprint(_QUOTE_PAT.split(s, 1)[0])
+    mo = _VALUES_HEAD_PAT.search(s)
+    s = s[:mo.end()] if mo else _IN_TAIL_PAT.sub('in (?+)', s)
+    return s + ' ...'
+
+
+@lru_cache(4096)
+def _cached_fingerprint(sql: str) -> str:
+    return _fingerprint(sql)
+
+
+def _fingerprint(sql: str) -> str:
+    s = _COMMENT_PAT.sub(' ', sql)
+    s = _STRING_PAT.sub('?', s)
+    s = _PARAM_PAT.sub('?', s)
+    s = _SPACE_PAT.sub(' ', s).strip().lower()
+    s = _NUMBER_PAT.sub('?', s)
+    s = _IN_PAT.sub('in (?+)', s)
+    s = _VALUES_PAT.sub(lambda mo: 'values ' + mo.group(1).replace(' ', ''), s)
+    return s
+
+
+# 耗时直方图，桶边界从0.1ms到约100s按1.25倍递增，百分位取所在桶的上界
+class LatencyHistogram(object):
+    BOUNDS: List[float] = [0.0001 * 1.25 ** i for i in range(63)]
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(self.BOUNDS) + 1)
+        self.count: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+
+    def add(self, secs: float):
+        self.counts[bisect.bisect_left(self.BOUNDS, secs)] += 1
+        self.count += 1
+        self.total += secs
+        self.max = max(self.max, secs)
+
+    def percentile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank, acc = q * self.count, 0
+        for idx, c in enumerate(self.counts):
+            acc += c
+            if acc >= rank:
+                return min(self.BOUNDS[idx], self.max) if idx < len(self.BOUNDS) else self.max
+        return self.max
+
+
+class SQLStat(object):
+    def __init__(self):
+        self.calls: int = 0
+        self.rows: int = 0
+        self.errors: int = 0
+        self.latency = LatencyHistogram()
+
+
+# 按 (server, SQL指纹) 聚合的调用次数、行数、错误数和耗时直方图 线程安全
+# 指纹数量超过max_fingerprints后新的指纹归入'<other>'，避免动态表名等导致内存无限增长
+class SQLStats(object):
+    OTHER = '<other>'
+
+    def __init__(self, max_fingerprints: int = 2000):
+        self.max_fingerprints = max_fingerprints
+        self._stats: Dict[Tuple[str, str], SQLStat] = dict()
+        self._lock = Lock()
+
+    # 指纹在加锁前计算 避免长语句的正则处理阻塞其他线程
+    def _get_stat(self, server: str, fingerprint: str) -> SQLStat:
+        key = (server, fingerprint)
+        stat = self._stats.get(key)
+        if stat is None:
+            if len(self._stats) >= self.max_fingerprints:
+                key = (server, self.OTHER)
+            stat = self._stats.setdefault(key, SQLStat())
+        return stat
+
+    def record(self, server: str, sql: str, cost: float, rows: int = 0, error: bool = False):
+        fingerprint = sql_fingerprint(sql)
+        with self._lock:
+            stat = self._get_stat(server, fingerprint)
+            stat.calls += 1
+            stat.rows += rows
+            stat.errors += int(error)
+            stat.latency.add(cost)
+
+    # 流式读取时行数在读取完成后才知道
+    def add_rows(self, server: str, sql: str, rows: int):
+        fingerprint = sql_fingerprint(sql)
+        with self._lock:
+            self._get_stat(server, fingerprint).rows += rows
+
+    # 按总耗时倒序
+    def snapshot(self, top: int = None) -> List[Dict]:
+        with self._lock:
+            items = [{
+                'server': server,
+                'fingerprint': fingerprint,
+                'calls': stat.calls,
+                'rows': stat.rows,
+                'errors': stat.errors,
+                'total_secs': stat.latency.total,
+                'avg_secs': stat.latency.total / stat.calls if stat.calls else 0.0,
+                'p50_secs': stat.latency.percentile(0.5),
+                'p95_secs': stat.latency.percentile(0.95),
+                'p99_secs': stat.latency.percentile(0.99),
+                'max_secs': stat.latency.max,
+            } for (server, fingerprint), stat in self._stats.items()]
+        items.sort(key=lambda x: x['total_secs'], reverse=True)
+        return items[:top] if top else items
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
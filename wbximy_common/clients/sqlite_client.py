@@ -2,12 +2,12 @@
 
 import time
 import logging
-from datetime import datetime, timedelta
 from threading import Lock
 from typing import Optional, Generator, TypeVar, Dict
 import sqlite3
 from dbutils.pooled_db import PooledDB
 from dbutils.persistent_db import PersistentDB
+from wbximy_common.libs.rate_limiter import TokenBucket
 
 logger = logging.getLogger(__name__)
 DBType = TypeVar('DBType', PersistentDB, PooledDB)
@@ -61,6 +61,9 @@ class SqliteClient(object):
             can_share: bool = True,  # using_persistent_db=True 当host/port 一致时 生效
             max_connections: int = 4,  # PooledDB有效，最大连接数
             max_write_per_minute: int = -1,  # -1为不限制 每分钟写入(insert/update)速度控制
+            max_write_per_second: float = -1,  # -1为不限制 每秒写入速度控制 优先于max_write_per_minute
+            write_burst: float = None,  # 写入速度控制允许的突发量 默认为1秒的写入量
+            write_limiter: Optional[TokenBucket] = None,  # 共享的限速器 如RedisTokenBucket 优先于以上配置
             auto_limit: bool = True,  # SQL语句是否补全limit
     ):
         super().__init__()
@@ -69,9 +72,11 @@ class SqliteClient(object):
         self._can_share: bool = can_share
         self._conn_pool: Optional[DBType] = None
         self._max_connections = max_connections
-        self._cur_write_minute: datetime = datetime.now()  # 速度控制，当前写入时间 分钟有效
-        self._cur_write_count: int = 0  # 速度控制，当前写入时间下的计数 insert+update
-        self._max_write_per_minute = max_write_per_minute
+        self._write_limiter: Optional[TokenBucket] = write_limiter  # 速度控制 insert+update
+        if self._write_limiter is None and max_write_per_second > 0:
+            self._write_limiter = TokenBucket(rate=max_write_per_second, burst=write_burst)
+        elif self._write_limiter is None and max_write_per_minute > 0:
+            self._write_limiter = TokenBucket(rate=max_write_per_minute / 60, burst=write_burst)
         self._auto_limit = auto_limit
         self.db_path = db_path
 
@@ -122,14 +127,13 @@ class SqliteClient(object):
         return Connection(conn, transaction)
 
     def _do_write_check(self, incr):
-        if self._max_write_per_minute >= 0 and incr > 0:
-            if self._cur_write_minute + timedelta(minutes=1) < datetime.now():
-                self._cur_write_minute = datetime.now()
-                self._cur_write_count = 0
-            if self._cur_write_count >= self._max_write_per_minute:
-                logger.warning('reach max write per minute %s, sleep for...', self._max_write_per_minute)
-                time.sleep(1.0)
-            self._cur_write_count += incr
+        if self._write_limiter is not None and incr > 0:
+            self._write_limiter.acquire(incr)
+
+    # 写入后按实际行数补扣令牌，不等待，透支的部分由后续写入等待
+    def _charge_write(self, incr):
+        if self._write_limiter is not None and incr > 0:
+            self._write_limiter.reserve(incr)
 
     def select(self, sql: str, params=None) -> Optional[dict]:
         params = params or {}
@@ -155,19 +159,19 @@ class SqliteClient(object):
                 row_dict = dict(zip([c[0] for c in conn.cursor.description], row))
                 yield row_dict
 
-    # 返回变更的行数
+    # 返回变更的行数 写入前先获取1个令牌，超出的行数在写入后补扣
     def execute(self, sql: str, params=None) -> int:
         params = params or {}
+        self._do_write_check(incr=1)
         with self.get_conn() as conn:
             rows_affected = conn.execute(sql, params)
-            self._do_write_check(incr=rows_affected)
-            return rows_affected
+        self._charge_write(incr=rows_affected - 1)
+        return rows_affected
 
     # 返回生效的row_id
     def insert(self, sql: str, params=None) -> int:
         params = params or {}
+        self._do_write_check(incr=1)
         with self.get_conn() as conn:
             conn.execute(sql, params)
-            if conn.cursor.lastrowid > 0:
-                self._do_write_check(incr=1)
             return conn.cursor.lastrowid
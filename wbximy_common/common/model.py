@@ -1,20 +1,52 @@
 # encoding=utf8
 
 from __future__ import annotations
-from typing import Optional
+from functools import lru_cache
+from typing import Optional, Set, List
 import logging
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr, TypeAdapter, ValidationError
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(None)
+def _list_adapter(cls) -> TypeAdapter:
+    return TypeAdapter(List[cls])
+
+
 # last update at 2024-09-26
 # 基于pydantic.BaseModel 的 dataclass 基类
 class CustomBaseModel(BaseModel):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        # if not self.logic_validate():
-        #    raise ValueError('logic validate error %s' % self.dict())
+    # 修改跟踪：None表示未跟踪(如直接构造的对象)，否则为mark_clean之后被赋值的字段
+    # 注意：只跟踪赋值，不跟踪对list/dict字段的原地修改
+    _dirty_fields: Optional[Set[str]] = PrivateAttr(default=None)
+
+    # 不重写__init__：重写后pydantic校验每个对象都要回调python层的__init__，from_dict_list的批量校验无法提速
+    # def __init__(self, **kwargs):
+    #     super().__init__(**kwargs)
+    #     if not self.logic_validate():
+    #        raise ValueError('logic validate error %s' % self.dict())
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if self._dirty_fields is not None and name in self.model_fields:
+            self._dirty_fields.add(name)
+
+    # model_copy 默认浅拷贝private属性，这里单独复制，避免副本之间共享修改记录
+    def __copy__(self):
+        o = super().__copy__()
+        if self._dirty_fields is not None:
+            o._dirty_fields = set(self._dirty_fields)
+        return o
+
+    # 开始跟踪：视为与数据库一致，此后被赋值的字段为已修改
+    # 直接写private存储，绕开BaseModel.__setattr__的检查，批量加载时这部分开销比校验还大
+    def mark_clean(self):
+        self.__pydantic_private__['_dirty_fields'] = set()
+
+    # None表示未跟踪
+    def dirty_fields(self) -> Optional[Set[str]]:
+        return None if self._dirty_fields is None else set(self._dirty_fields)
 
     # __init__ 会 raise Exception
     # from_dict 不会 raise Exception， 业务使用方便
@@ -25,11 +57,35 @@ class CustomBaseModel(BaseModel):
         try:
             o = cls.__new__(cls)
             o.__init__(**d)
+            o.mark_clean()
             return o
         except Exception as e:
             logger.warning(f'e={e} d={d}')
             return None
 
+    # 批量转换，整批数据一次校验(TypeAdapter(List[cls]))，结果与ds一一对应
+    # 整批校验失败时退化为逐行from_dict，失败的行逐行记录并返回None
+    # trusted=True 时用model_construct直接构造，跳过校验、类型转换和自定义validator，仅用于来自自有表、类型已经正确的数据
+    # 注意：普通字段的批量校验在pydantic-core中完成，并不比model_construct慢，trusted主要省去validator等python层开销
+    @classmethod
+    def from_dict_list(cls, ds: List[Optional[dict]], trusted=False) -> List[Optional[BaseModel]]:
+        if trusted:
+            results = [None if d is None else cls.model_construct(**d) for d in ds]
+            for o in results:
+                if o is not None:
+                    o.mark_clean()
+            return results
+        results = [None] * len(ds)
+        indexes = [i for i, d in enumerate(ds) if d is not None]
+        try:
+            objs = _list_adapter(cls).validate_python([ds[i] for i in indexes])
+        except ValidationError:
+            return [cls.from_dict(d) for d in ds]
+        for i, o in zip(indexes, objs):
+            o.mark_clean()
+            results[i] = o
+        return results
+
     # 用于运行时合理性检查，暂时关闭，没有需求，且耗性能
     # def logic_validate(self) -> bool:
     #     logger.debug('%s', self.__dict__)
@@ -42,6 +98,12 @@ class CustomBaseModel(BaseModel):
     def to_dict(self) -> dict:
         return self.model_dump(by_alias=True, mode='json')
 
+    # 只包含已修改的字段，未跟踪时返回全部字段
+    def to_dirty_dict(self) -> dict:
+        if self._dirty_fields is None:
+            return self.to_dict()
+        return self.model_dump(by_alias=True, mode='json', include=self._dirty_fields)
+
     # class Config:
     #    # https://stackoverflow.com/questions/62025723/how-to-validate-a-pydantic-object-after-editing-it
     #    validate_assignment = True
@@ -0,0 +1,147 @@
+# encoding=utf8
+
+import asyncio
+import logging
+from typing import Type, Dict, Optional, AsyncGenerator, List, Tuple
+import pymysql.err
+from wbximy_common.clients.aio_mysql_client import AioMySQLClient
+from wbximy_common.common.model import CustomBaseModel
+from wbximy_common.dao.mysql_dao import EntityType, PKType, ScanKeyType, ScanOffsetType, _scan_iter_plan
+from wbximy_common.libs.collection import asplit_iter
+
+logger = logging.getLogger(__name__)
+
+
+# AioMySQLDao：MySQLDao的asyncio版本，对应一张具体的物理表
+class AioMySQLDao(AioMySQLClient):
+    def __init__(
+            self,
+            db_tb_name: str,
+            batch_size: int = 2000,
+            entity_class: Type[EntityType] = None,
+            trusted: bool = False,  # 批量读取时不做校验直接构造实体 见CustomBaseModel.from_dict_list
+            **kwargs,
+    ):
+        self.db_tb_name: str = db_tb_name  # 指定库表名称
+        self.batch_size: int = batch_size  # 批量读取数据的大小
+        self.entity_class: Type[EntityType] = entity_class or dict  # 实体类
+        self.trusted: bool = trusted
+        super().__init__(**kwargs)
+
+    def _to_entity(self, d: Optional[Dict]) -> Optional[EntityType]:
+        if d is None:
+            return None
+        if issubclass(self.entity_class, dict):
+            return d
+        return self.entity_class.from_dict(d)
+
+    def _to_entities(self, ds: List[Optional[Dict]]) -> List[Optional[EntityType]]:
+        if issubclass(self.entity_class, dict):
+            return ds
+        return self.entity_class.from_dict_list(ds, trusted=self.trusted)
+
+    async def get(self, **kwargs) -> Optional[EntityType]:
+        sql_where = ('where ' if kwargs else ' ') + ' and '.join(f'{k}=%({k})s' for k in kwargs.keys())
+        sql = f'select * from {self.db_tb_name} {sql_where} limit 1'
+        d = await self.select(sql, args=kwargs)
+        return self._to_entity(d)
+
+    async def get_by_id(self, _id: PKType):
+        return await self.get(id=_id)
+
+    # limit should always set. default is self.batch_size
+    # stream=True 时流式读取，未指定limit则读取全部数据
+    async def get_many(self, limit=None, stream=False, **kwargs) -> AsyncGenerator[EntityType, None]:
+        sql_where = ('where ' if kwargs else ' ') + ' and '.join(
+            f'{k} {"is" if v is None else "="} %({k})s' for k, v in kwargs.items())
+        sql = f'select * from {self.db_tb_name} {sql_where}'
+        if not stream or limit is not None:
+            limit = limit or self.batch_size
+            sql += ' limit %(limit)s'
+            kwargs = kwargs | {'limit': limit}
+        ds = self.select_many(sql, args=kwargs, stream=stream)
+        parts = asplit_iter(ds, self.batch_size)
+        try:
+            async for part in parts:
+                for item in self._to_entities(part):
+                    if item is not None:
+                        yield item
+        finally:
+            await parts.aclose()
+            await ds.aclose()
+
+    # 如果设置id，则按照id进行update，如果未设置id，则进行insert ignore逻辑，返回是否变更
+    # 跟踪修改的CustomBaseModel(如from_dict加载)update时只写入修改过的字段，没有修改时不执行
+    async def save_by_id(self, o: EntityType, ignore_create_update_time=True) -> bool:
+        if isinstance(o, CustomBaseModel) and o.dirty_fields() is not None and getattr(o, 'id', None):
+            d = o.to_dirty_dict()
+            d.pop('id', None)
+            oid = o.id
+        else:
+            d = o.to_dict() if isinstance(o, CustomBaseModel) else dict(o)
+            oid = d.pop('id')
+        if ignore_create_update_time:
+            d.pop('create_time', '')
+            d.pop('update_time', '')
+        if oid and not d:
+            return False
+        sql_sets = ', '.join(f'{k}=%({k})s' for k in d)
+        if not oid:
+            sql = f'insert ignore {self.db_tb_name} set {sql_sets}'
+            oid = await self.insert(sql, args=d)
+            if isinstance(o, CustomBaseModel):
+                o.id = oid
+                o.mark_clean()
+            else:
+                o['id'] = oid
+            return oid > 0
+        else:
+            sql = f'update {self.db_tb_name} set {sql_sets} where id=%(id)s limit 1'
+            try:
+                changed = await self.execute(sql, args=d | {'id': oid})
+            except pymysql.err.IntegrityError:
+                return False
+            if isinstance(o, CustomBaseModel):
+                o.mark_clean()
+            return changed == 1
+
+    # 见MySQLDao.scan_iter 单列或多列scan_key
+    async def scan_iter(
+            self,
+            offset: ScanOffsetType,
+            scan_key: ScanKeyType,
+            count: int,
+            end: Optional[PKType] = None,  # 包括end，仅单列时有效
+    ) -> Tuple[ScanOffsetType, List[EntityType]]:
+        plan = _scan_iter_plan(self.db_tb_name, offset, scan_key, count, end=end)
+        sql, args = next(plan)
+        while True:
+            try:
+                sql, args = plan.send([d async for d in self.select_many(sql=sql, args=args)])
+            except StopIteration as e:
+                next_offset, ds = e.value
+                return next_offset, [item for item in self._to_entities(ds) if item is not None]
+
+    # 根据索引循环遍历数据， 基于scan_iter
+    async def scan(
+            self,
+            start,
+            scan_key: ScanKeyType = 'id',  # 单列或多列 多列时start为对应的tuple
+            total=0,
+            infinite_sleep_secs: int = 0,
+    ) -> AsyncGenerator[EntityType, None]:
+        count, offset = 0, start if isinstance(scan_key, str) else tuple(start)
+        while True:
+            next_offset, items = await self.scan_iter(offset=offset, scan_key=scan_key, count=self.batch_size)
+            for item in items:
+                yield item
+                count += 1
+                if 0 < total <= count:
+                    break
+            logger.info(f'{self.db_tb_name} offset {offset}->{next_offset}')
+            if infinite_sleep_secs > 0 and next_offset == offset:
+                logger.info(f'{self.db_tb_name} sleep {infinite_sleep_secs} for next scan')
+                await asyncio.sleep(infinite_sleep_secs)
+            if offset == next_offset or 0 < total <= count:
+                break
+            offset = next_offset
@@ -2,26 +2,100 @@
 
 import logging
 import time
-from typing import Type, Dict, TypeVar, Optional, Generator, List, Tuple
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Type, Dict, TypeVar, Optional, Generator, List, Tuple, Union, Set
 from datetime import date, datetime
 import pymysql.err
 from pymysql import ProgrammingError
-from wbximy_common.clients.mysql_client import MySQLClient
+from pydantic_core import to_jsonable_python
+from wbximy_common.clients.mysql_client import MySQLClient, Connection
+from wbximy_common.clients.redis.redis_hash import RedisHash
 from wbximy_common.common.model import CustomBaseModel
+from wbximy_common.libs.cache import TTLCache
+from wbximy_common.libs.concurrent import prefetch as prefetch_iter
+from wbximy_common.libs.collection import split_parts, split_iter
 
 logger = logging.getLogger(__name__)
 
 EntityType = TypeVar('EntityType', CustomBaseModel, Dict)
 PKType = TypeVar('PKType', int, str, datetime, date)
+ScanKeyType = Union[str, Tuple[str, ...]]  # 单列或多列(keyset)
+ScanOffsetType = Union[PKType, Tuple]
+SAVE_MODES = ('ignore', 'replace', 'upsert')
+ScanPlanType = Generator[Tuple[str, Tuple], List[Dict], Tuple[ScanOffsetType, List[Dict]]]
+
+
+# 缓存key中的值与CustomBaseModel.to_dict(json模式)一致：datetime/date为iso格式字符串，Decimal为字符串
+# 查询条件(Python对象)和写入后失效(to_dict的结果)按同样的方式转换，才能对应到同一条缓存
+def _cache_value(v):
+    if v is None or isinstance(v, (str, int, float)):
+        return v
+    return to_jsonable_python(v)
+
+
+# 返回 (where条件, order by) 多列时使用行值比较 (a, b) > (%s, %s)
+def _keyset_sql(scan_key: ScanKeyType) -> Tuple[str, str]:
+    if isinstance(scan_key, str):
+        return f'{scan_key} > %s', scan_key
+    columns = ', '.join(scan_key)
+    placeholders = ', '.join(['%s'] * len(scan_key))
+    return f'({columns}) > ({placeholders})', columns
+
+
+# scan_iter的查询步骤，MySQLDao和AioMySQLDao共用：依次产出要执行的 (sql, args)，调用方send回查询结果，最终返回 (next_offset, rows)
+# 单列时按 (scan_key, pk) 排序读取count条，结果被count截断时最后一组scan_key相同的数据可能不完整，
+# 按 (scan_key, pk) 每次count条分页读完这一组，下次从该值之后读取不会漏掉数据；同值的数据很多时建议使用多列scan_key
+def _scan_iter_plan(
+        db_tb_name: str,
+        offset: ScanOffsetType,
+        scan_key: ScanKeyType,
+        count: int,
+        end: Optional[PKType] = None,
+        pk: str = 'id',
+) -> ScanPlanType:
+    if not isinstance(scan_key, str):
+        assert end is None
+        sql_where, sql_order = _keyset_sql(scan_key)
+        rows = yield f'select * from {db_tb_name} where {sql_where} order by {sql_order} limit %s', (*offset, count)
+        return (tuple(rows[-1][k] for k in scan_key) if rows else tuple(offset)), rows
+    sql_end, args_end = ('', ()) if end is None else (f' and {scan_key} <= %s', (end, ))
+    sql_order = scan_key if scan_key == pk else f'{scan_key}, {pk}'
+    sql = f'select * from {db_tb_name} where {scan_key} > %s{sql_end} order by {sql_order} limit %s'
+    rows = yield sql, (offset, *args_end, count)
+    if not rows:
+        return offset, rows
+    last = rows[-1][scan_key]
+    if len(rows) >= count and scan_key != pk:
+        sql = f'select * from {db_tb_name} where {scan_key} = %s and {pk} > %s order by {pk} limit %s'
+        while True:
+            page = yield sql, (last, rows[-1][pk], count)
+            rows += page
+            if len(page) < count:
+                break
+    return last, rows
 
 
 # last update at 2024-09-26
 # MySQLDao：对应一张具体的物理表
 class MySQLDao(MySQLClient):
-    def __init__(self, db_tb_name: str, batch_size: int = 2000, entity_class: Type[EntityType] = None, **kwargs):
+    def __init__(
+            self,
+            db_tb_name: str,
+            batch_size: int = 2000,
+            entity_class: Type[EntityType] = None,
+            max_packet_bytes: int = 4 * 1024 * 1024,  # save_many单条语句的最大字节数 不超过服务端max_allowed_packet
+            cache: Optional[TTLCache] = None,  # get/get_by_id的进程内缓存 通过本Dao的写入会使其失效
+            trusted: bool = False,  # 批量读取时不做校验直接构造实体 见CustomBaseModel.from_dict_list
+            **kwargs,
+    ):
         self.db_tb_name: str = db_tb_name  # 指定库表名称
         self.batch_size: int = batch_size  # 批量读取数据的大小
         self.entity_class: Type[EntityType] = entity_class or dict  # 实体类
+        self.max_packet_bytes: int = max_packet_bytes
+        self.cache: Optional[TTLCache] = cache
+        self.trusted: bool = trusted
+        self._cache_columns: Set[Tuple[str, ...]] = set()  # get查询过的列组合 用于写入时失效负缓存
         super().__init__(**kwargs)
 
     def _to_entity(self, d: Optional[Dict]) -> Optional[EntityType]:
@@ -31,24 +105,106 @@ class MySQLDao(MySQLClient):
             return d
         return self.entity_class.from_dict(d)
 
+    # 批量转换 结果与ds一一对应，转换失败为None
+    def _to_entities(self, ds: List[Optional[Dict]]) -> List[Optional[EntityType]]:
+        if issubclass(self.entity_class, dict):
+            return ds
+        return self.entity_class.from_dict_list(ds, trusted=self.trusted)
+
     def get(self, **kwargs) -> Optional[EntityType]:
+        cache_key = self._cache_key(kwargs)
+        if cache_key is not None:
+            hit, o = self.cache.get(cache_key)
+            if hit:
+                return self._copy_entity(o)
+            version = self.cache.version()
         sql_where = ('where ' if kwargs else ' ') + ' and '.join(f'{k}=%({k})s' for k in kwargs.keys())
         sql = f'select * from {self.db_tb_name} {sql_where} limit 1'
         d = self.select(sql, args=kwargs)
-        return self._to_entity(d)
+        o = self._to_entity(d)
+        if cache_key is not None:
+            tags = [('id', _cache_value(d['id']))] if d and 'id' in d else []
+            self.cache.set(cache_key, self._copy_entity(o), tags=tags, version=version)
+        return o
+
+    def _cache_key(self, kwargs: Dict) -> Optional[Tuple]:
+        if self.cache is None:
+            return None
+        columns = tuple(sorted(kwargs))
+        cache_key = (columns, tuple(_cache_value(kwargs[k]) for k in columns))
+        try:
+            hash(cache_key)
+        except TypeError:
+            return None
+        self._cache_columns.add(columns)
+        return cache_key
+
+    # 缓存中保存的是副本，避免调用方修改返回的实体影响缓存
+    @staticmethod
+    def _copy_entity(o: Optional[EntityType]) -> Optional[EntityType]:
+        if o is None:
+            return None
+        if isinstance(o, CustomBaseModel):
+            return o.model_copy()
+        return dict(o)
+
+    # 写入d后失效：包含该id实体的条目，以及按d的值查询的条目(可能是负缓存)
+    def _cache_invalidate(self, d: Dict):
+        if self.cache is None:
+            return
+        if d.get('id'):
+            self.cache.invalidate_tag(('id', _cache_value(d['id'])))
+        for columns in list(self._cache_columns):
+            if all(c in d for c in columns):
+                cache_key = (columns, tuple(_cache_value(d[c]) for c in columns))
+                try:
+                    self.cache.invalidate(cache_key)
+                except TypeError:  # 不可hash的值不会被缓存
+                    pass
+
+    def cache_stats(self) -> Optional[Dict]:
+        return None if self.cache is None else self.cache.stats()
 
     def get_by_id(self, _id: PKType):
         return self.get(id=_id)
 
     # limit should always set. default is self.batch_size
-    def get_many(self, limit=None, **kwargs) -> Generator[EntityType, None, None]:
-        limit = limit or self.batch_size
-        sql_where = ' and '.join(f'{k} {"is" if v is None else "="} %({k})s' for k, v in kwargs.items())
-        sql = f'select * from {self.db_tb_name} where {sql_where} limit %(limit)s'
-        for d in self.select_many(sql, args=kwargs | {'limit': limit}):
-            item = self._to_entity(d)
-            if item is not None:
-                yield item
+    # stream=True 时流式读取，未指定limit则读取全部数据
+    # order_by 排序列，desc为倒序
+    def get_many(
+            self,
+            limit=None,
+            stream=False,
+            order_by: Optional[str] = None,
+            desc: bool = False,
+            **kwargs,
+    ) -> Generator[EntityType, None, None]:
+        sql_where = ('where ' if kwargs else ' ') + ' and '.join(
+            f'{k} {"is" if v is None else "="} %({k})s' for k, v in kwargs.items())
+        sql = f'select * from {self.db_tb_name} {sql_where}'
+        if order_by:
+            sql += f' order by {order_by}' + (' desc' if desc else '')
+        if not stream or limit is not None:
+            limit = limit or self.batch_size
+            sql += ' limit %(limit)s'
+            kwargs = kwargs | {'limit': limit}
+        for ds in split_iter(self.select_many(sql, args=kwargs, stream=stream), self.batch_size):
+            for item in self._to_entities(ds):
+                if item is not None:
+                    yield item
+
+    # 按key批量查询，每批 where key in (...) 最多batch_size个值，返回与values一一对应的结果，未找到为None
+    # key不唯一时取其中一条；values的类型需与数据库返回的类型一致(如int列不要传str)
+    def get_many_by_keys(self, key: str, values: List) -> List[Optional[EntityType]]:
+        found: Dict = dict()
+        sql = f'select * from {self.db_tb_name} where {key} in %s'
+        for part in split_parts(list(dict.fromkeys(values)), self.batch_size):
+            for d in self.select_many(sql, args=(part, )):
+                found.setdefault(d[key], d)
+        return self._to_entities([found.get(v) for v in values])
+
+    def get_many_by_ids(self, ids: List[PKType]) -> List[Optional[EntityType]]:
+        return self.get_many_by_keys('id', ids)
 
     def get_max_id(self) -> PKType:
         sql = f'select max(id) from {self.db_tb_name}'
@@ -63,18 +219,28 @@ class MySQLDao(MySQLClient):
         return True
 
     # 如果设置id，则按照id进行update，如果未设置id，则进行insert ignore逻辑，返回是否变更
+    # 跟踪修改的CustomBaseModel(如from_dict加载)update时只写入修改过的字段，没有修改时不执行
     def save_by_id(self, o: EntityType, ignore_create_update_time=True) -> bool:
-        d = o.to_dict() if isinstance(o, CustomBaseModel) else o
-        oid = d.pop('id')
+        if isinstance(o, CustomBaseModel) and o.dirty_fields() is not None and getattr(o, 'id', None):
+            d = o.to_dirty_dict()
+            d.pop('id', None)
+            oid = o.id
+        else:
+            d = o.to_dict() if isinstance(o, CustomBaseModel) else o
+            oid = d.pop('id')
         if ignore_create_update_time:
             d.pop('create_time', '')
             d.pop('update_time', '')
+        if oid and not d:
+            return False
         sql_sets = ', '.join(f'{k}=%({k})s' for k in d)
         if not oid:
             sql = f'insert ignore {self.db_tb_name} set {sql_sets}'
             oid = self.insert(sql, args=d)
+            self._cache_invalidate(d | {'id': oid})
             if isinstance(o, CustomBaseModel):
                 o.id = oid
+                o.mark_clean()
             else:
                 o['id'] = oid
             return oid > 0
@@ -84,40 +250,248 @@ class MySQLDao(MySQLClient):
                 changed = self.execute(sql, args=d | {'id': oid})
             except pymysql.err.IntegrityError:
                 return False
+            if isinstance(o, CustomBaseModel):
+                o.mark_clean()
+            # 按完整的行失效：只修改了部分列时，包含未修改列的查询条件(如负缓存)也可能因此匹配到该行
+            self._cache_invalidate((o.to_dict() if isinstance(o, CustomBaseModel) else d) | {'id': oid})
             # if changed > 1:
             #     logger.warning(f'changed={changed} > 1, error o={o.to_json()}')
             return changed == 1
 
-    # def save_by_group(self):
-    #     pass
+    # 批量写入，每批拼成一条 insert ... values (...),(...) 语句，按行数(batch_size)和字节数(max_packet_bytes)切分
+    # mode: ignore=insert ignore, replace=replace into, upsert=insert ... on duplicate key update
+    # 返回与entities一一对应的语句是否执行成功，批量语句报错时退化为逐行写入以定位失败的行
+    # 结果只表示该行所在的语句执行成功，不表示该行有变更：如insert ignore因唯一键冲突被忽略的行同样为True
+    # 注意：不回填自增id
+    def save_many(self, entities: List[EntityType], mode='ignore', ignore_create_update_time=True) -> List[bool]:
+        assert mode in SAVE_MODES
+        rows = [self._to_save_dict(o, ignore_create_update_time) for o in entities]
+        try:
+            return self._save_many(rows, mode)
+        finally:
+            # replace/upsert 无id的行可能通过唯一键覆盖了任意id的数据，只能清空缓存
+            if self.cache is not None and mode != 'ignore' and not all(d.get('id') for d in rows):
+                self.cache.clear()
+            for d in rows:
+                self._cache_invalidate(d)
 
-    # 不包括offset位置，选取「大约」count条数据， 大约：用于保证next_offset值的数据scan完整
-    def scan_iter(self, offset: PKType, scan_key: str, count: int) -> Tuple[PKType, List[EntityType]]:
-        sql = f'select * from {self.db_tb_name} where {scan_key} > %s limit %s'
-        next_offset, items = offset, []
-        for did, d in enumerate(self.select_many(sql=sql, args=(offset, int(count*1.2)))):
-            if did >= count and d[scan_key] != next_offset:
-                break
-            next_offset = d[scan_key]
-            item = self._to_entity(d)
-            if item is not None:
-                items.append(item)
-        return next_offset, items
+    # 列相同的行使用同一个连接完成转义和写入；每条批量语句写入前按行数获取一次令牌，逐行重试时不再重复获取
+    def _save_many(self, rows: List[Dict], mode) -> List[bool]:
+        results = [False] * len(rows)
+        for part in split_parts(list(range(len(rows))), self.batch_size):
+            # 列相同的行才能拼在同一条语句中
+            groups: Dict[Tuple[str, ...], List[int]] = {}
+            for i in part:
+                groups.setdefault(tuple(rows[i].keys()), []).append(i)
+            for columns, indexes in groups.items():
+                stats_sql = self._build_save_sql(mode, columns, [self._values_placeholder(columns)])
+                with self.get_conn() as conn:
+                    values = self._to_sql_values(conn, [rows[i] for i in indexes], columns)
+                    for chunk in self._split_by_bytes(list(zip(indexes, values)), mode, columns):
+                        self._do_write_check(incr=len(chunk))
+                        sql = self._build_save_sql(mode, columns, [v for _, v in chunk])
+                        try:
+                            conn.execute(sql, None, stats_sql=stats_sql)
+                            for i, _ in chunk:
+                                results[i] = True
+                        except (pymysql.err.IntegrityError, pymysql.err.DataError, pymysql.err.InternalError) as e:
+                            logger.warning(f'{self.db_tb_name} save_many chunk={len(chunk)} e={e}, retry one by one')
+                            for i, v in chunk:
+                                results[i] = self._save_one_values(conn, mode, columns, v, stats_sql)
+        return results
+
+    @staticmethod
+    def _to_save_dict(o: EntityType, ignore_create_update_time) -> dict:
+        d = o.to_dict() if isinstance(o, CustomBaseModel) else dict(o)
+        if not d.get('id'):
+            d.pop('id', None)
+        if ignore_create_update_time:
+            d.pop('create_time', '')
+            d.pop('update_time', '')
+        return d
+
+    @staticmethod
+    def _values_placeholder(columns: Tuple[str, ...]) -> str:
+        return '(' + ','.join(['%s'] * len(columns)) + ')'
+
+    # 与pymysql的executemany一致，通过写入使用的连接转义，遵循服务端的字符集和NO_BACKSLASH_ESCAPES等设置
+    def _to_sql_values(self, conn: Connection, rows: List[dict], columns: Tuple[str, ...]) -> List[str]:
+        placeholder = self._values_placeholder(columns)
+        return [conn.cursor.mogrify(placeholder, tuple(d[c] for c in columns)) for d in rows]
+
+    # upsert没有可更新的列(只有id)时退化为insert ignore
+    def _build_save_sql(self, mode, columns: Tuple[str, ...], values: List[str]) -> str:
+        sql_columns = ', '.join(columns)
+        sql_values = ','.join(values)
+        sql_updates = ', '.join(f'{c}=values({c})' for c in columns if c != 'id')
+        if mode == 'replace':
+            return f'replace into {self.db_tb_name} ({sql_columns}) values {sql_values}'
+        if mode == 'ignore' or not sql_updates:
+            return f'insert ignore into {self.db_tb_name} ({sql_columns}) values {sql_values}'
+        sql = f'insert into {self.db_tb_name} ({sql_columns}) values {sql_values}'
+        return f'{sql} on duplicate key update {sql_updates}'
+
+    # 保证每条语句不超过max_packet_bytes，单行超过上限时单独成句
+    def _split_by_bytes(self, items: List[Tuple[int, str]], mode, columns) -> Generator[List, None, None]:
+        base_size = len(self._build_save_sql(mode, columns, []).encode('utf8'))
+        chunk, chunk_size = [], base_size
+        for i, v in items:
+            size = len(v.encode('utf8')) + 1
+            if chunk and chunk_size + size > self.max_packet_bytes:
+                yield chunk
+                chunk, chunk_size = [], base_size
+            chunk.append((i, v))
+            chunk_size += size
+        if chunk:
+            yield chunk
+
+    # 所在的批量语句已经获取过令牌
+    def _save_one_values(self, conn: Connection, mode, columns, v: str, stats_sql: str = None) -> bool:
+        try:
+            conn.execute(self._build_save_sql(mode, columns, [v]), None, stats_sql=stats_sql)
+        except (pymysql.err.IntegrityError, pymysql.err.DataError, pymysql.err.InternalError) as e:
+            logger.warning(f'{self.db_tb_name} save_many fail values={v} e={e}')
+            return False
+        return True
+
+    # scan_key为单列时：不包括offset位置，选取count条数据，最后一组scan_key相同的数据会读取完整，用于保证next_offset值的数据scan完整
+    # scan_key为多列时(如('update_time', 'id'))：offset为对应的tuple，按行值比较精确选取count条数据，非唯一列也能持续推进
+    def scan_iter(
+            self,
+            offset: ScanOffsetType,
+            scan_key: ScanKeyType,
+            count: int,
+            end: Optional[PKType] = None,  # 包括end，仅单列时有效
+    ) -> Tuple[ScanOffsetType, List[EntityType]]:
+        plan = _scan_iter_plan(self.db_tb_name, offset, scan_key, count, end=end)
+        sql, args = next(plan)
+        while True:
+            try:
+                sql, args = plan.send(list(self.select_many(sql=sql, args=args)))
+            except StopIteration as e:
+                next_offset, ds = e.value
+                return next_offset, [item for item in self._to_entities(ds) if item is not None]
 
     # 根据索引循环遍历数据， 基于scan_iter
-    def scan(self, start, scan_key='id', total=0, infinite_sleep_secs: int = 0) -> Generator[EntityType, None, None]:
-        count, offset = 0, start
+    # stream=True 时不再分批查询，而是一条SQL流式读取全部 offset之后的数据
+    # prefetch>0 时在后台线程中提前读取至多prefetch批数据，使查询与消费重叠
+    def scan(
+            self,
+            start,
+            scan_key: ScanKeyType = 'id',  # 单列或多列 多列时start为对应的tuple
+            total=0,
+            infinite_sleep_secs: int = 0,
+            stream=False,
+            prefetch: int = 0,
+    ) -> Generator[EntityType, None, None]:
+        if stream:
+            yield from self._scan_stream(start, scan_key, total, infinite_sleep_secs)
+            return
+        batches = self._scan_batches(start, scan_key, infinite_sleep_secs)
+        if prefetch > 0:
+            batches = prefetch_iter(batches, depth=prefetch, name='scan_prefetch')
+        count = 0
+        try:
+            for items in batches:
+                for item in items:
+                    yield item
+                    count += 1
+                    if 0 < total <= count:
+                        return
+        finally:
+            batches.close()
+
+    def _scan_batches(self, start, scan_key, infinite_sleep_secs) -> Generator[List[EntityType], None, None]:
+        offset = start if isinstance(scan_key, str) else tuple(start)
         while True:
             next_offset, items = self.scan_iter(offset=offset, scan_key=scan_key, count=self.batch_size)
-            for item in items:
-                yield item
-                count += 1
-                if 0 < total <= count:
-                    break
+            yield items
             logger.info(f'{self.db_tb_name} offset {offset}->{next_offset}')
             if infinite_sleep_secs > 0 and next_offset == offset:
                 logger.info(f'{self.db_tb_name} sleep {infinite_sleep_secs} for next scan')
                 time.sleep(infinite_sleep_secs)
-            if offset == next_offset or 0 < total <= count:
+            if offset == next_offset:
+                break
+            offset = next_offset
+
+    def _scan_stream(self, start, scan_key, total, infinite_sleep_secs) -> Generator[EntityType, None, None]:
+        sql_where, sql_order = _keyset_sql(scan_key)
+        sql = f'select * from {self.db_tb_name} where {sql_where} order by {sql_order}'
+        count, offset = 0, start if isinstance(scan_key, str) else tuple(start)
+        while True:
+            next_offset = offset
+            args = (offset, ) if isinstance(scan_key, str) else offset
+            for ds in split_iter(self.select_many(sql, args=args, stream=True), self.batch_size):
+                d = ds[-1]
+                next_offset = d[scan_key] if isinstance(scan_key, str) else tuple(d[k] for k in scan_key)
+                for item in self._to_entities(ds):
+                    if item is not None:
+                        yield item
+                        count += 1
+                        if 0 < total <= count:
+                            return
+            logger.info(f'{self.db_tb_name} offset {offset}->{next_offset}')
+            if infinite_sleep_secs <= 0:
                 break
+            if next_offset == offset:
+                logger.info(f'{self.db_tb_name} sleep {infinite_sleep_secs} for next scan')
+                time.sleep(infinite_sleep_secs)
             offset = next_offset
+
+    # 按scan_key(整数索引列)的范围(start, end]切分为part_num段，用worker_num个线程并行读取，批次就绪即返回
+    # offsets_cache记录每段的断点 f'{part_id:03d}' 和结束位置 f'{part_id:03d}.end'，缓存完整时从断点继续
+    def partition_scan(
+            self,
+            part_num: int = 4,
+            worker_num: int = 4,
+            scan_key: str = 'id',
+            start: int = None,  # 不包括start，默认min(scan_key)-1
+            end: int = None,  # 包括end，默认max(scan_key)
+            offsets_cache: RedisHash = None,
+    ) -> Generator[List[EntityType], None, None]:
+        offsets, ends = self._load_partitions(part_num, scan_key, start, end, offsets_cache)
+        pending = deque(part_id for part_id in range(len(offsets)) if offsets[part_id] < ends[part_id])
+        with ThreadPoolExecutor(max_workers=worker_num, thread_name_prefix='partition_scan') as executor:
+            futures: Dict[Future, int] = dict()
+            while pending or futures:
+                while pending and len(futures) < worker_num:
+                    part_id = pending.popleft()
+                    future = executor.submit(self.scan_iter, offsets[part_id], scan_key, self.batch_size, ends[part_id])
+                    futures[future] = part_id
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    part_id = futures.pop(future)
+                    next_offset, items = future.result()
+                    msg = f'{self.db_tb_name} part {part_id} {offsets[part_id]}->{next_offset}'
+                    logger.info(f'{msg} count={len(items)}')
+                    if items:
+                        yield items
+                    if offsets_cache is not None:
+                        offsets_cache.set(f'{part_id:03d}', next_offset)
+                    if next_offset != offsets[part_id]:
+                        offsets[part_id] = next_offset
+                        pending.append(part_id)
+
+    # 返回各分区的 (offsets, ends)，空表返回空列表(不扫描，也不写入offsets_cache)
+    def _load_partitions(self, part_num, scan_key, start, end, offsets_cache) -> Tuple[List[int], List[int]]:
+        if offsets_cache is not None:
+            offsets = offsets_cache.get_many([f'{part_id:03d}' for part_id in range(part_num)])
+            ends = offsets_cache.get_many([f'{part_id:03d}.end' for part_id in range(part_num)])
+            if None not in offsets and None not in ends:
+                logger.info(f'{self.db_tb_name} partition_scan resume from {offsets}')
+                return offsets, ends
+        if start is None or end is None:
+            d = self.select(f'select min({scan_key}) as min_key, max({scan_key}) as max_key from {self.db_tb_name}')
+            if d['min_key'] is None or d['max_key'] is None:
+                logger.info(f'{self.db_tb_name} partition_scan empty table')
+                return [], []
+            start = d['min_key'] - 1 if start is None else start
+            end = d['max_key'] if end is None else end
+        step = max(1, -(-(end - start) // part_num))
+        offsets = [min(end, start + step * part_id) for part_id in range(part_num)]
+        ends = [min(end, start + step * (part_id + 1)) for part_id in range(part_num)]
+        if offsets_cache is not None:
+            offsets_cache.set_many({f'{part_id:03d}': offsets[part_id] for part_id in range(part_num)}
+                                   | {f'{part_id:03d}.end': ends[part_id] for part_id in range(part_num)})
+        logger.info(f'{self.db_tb_name} partition_scan ({start}, {end}] part_num={part_num} step={step}')
+        return offsets, ends
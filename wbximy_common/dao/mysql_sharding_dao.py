@@ -1,14 +1,22 @@
 # encoding=utf8
 
 import time
+import queue
+import heapq
 import logging
+import threading
 from abc import abstractmethod
-from concurrent.futures import Future
-from typing import List, Optional, Generator, Tuple
+from collections import deque
+from itertools import islice
+from threading import Lock
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from typing import List, Optional, Generator, Tuple, Dict, Callable, Any, Iterable
 from concurrent.futures.thread import ThreadPoolExecutor
 from wbximy_common.clients.redis.redis_hash import RedisHash
+from wbximy_common.clients.redis.redis_lease import RedisLease
 from wbximy_common.dao.mysql_dao import EntityType
 from wbximy_common.dao.mysql_dao import MySQLDao, PKType
+from wbximy_common.libs.collection import split_iter
 
 logger = logging.getLogger(__name__)
 
@@ -18,12 +26,17 @@ class MySQLShardingDao(object):
     def __init__(
             self,
             sharding_key='id',
+            scatter_worker_num: int = 8,  # scatter_get/scatter_get_many 并行查询的线程数
             **kwargs,
     ):
         self.sharding_key = sharding_key
         self.mysql_dao_list: List[MySQLDao] = self.get_sharding_dao_list(**kwargs)
         assert len(self.mysql_dao_list) > 0
         self.entity_class = self.mysql_dao_list[0].entity_class
+        self.scatter_worker_num: int = scatter_worker_num
+        # 多次调用共用；超时的查询无法中断，会继续占用线程直到结束，此时新的查询排队等待，排队时间计入超时
+        self._scatter_executor: Optional[ThreadPoolExecutor] = None
+        self._scatter_executor_lock = Lock()
 
     # 给定v 给出 分库分表位置
     @classmethod
@@ -52,7 +65,249 @@ class MySQLShardingDao(object):
         dao = self.mysql_dao_list[self.do_sharding(sharding_value)]
         return dao.get_many(**kwargs)
 
+    # 按分表键批量查询，按do_sharding分组后各分表并行查询，返回与values一一对应的结果，未找到为None
+    def get_many_by_keys(self, key: str, values: List, worker_num: int = 4) -> List[Optional[EntityType]]:
+        if key != self.sharding_key:
+            msg = f'{key} is not sharding key {self.sharding_key}'
+            raise RuntimeError(msg)
+        groups: Dict[int, List] = dict()
+        for v in values:
+            groups.setdefault(self.do_sharding(v), []).append(v)
+        found: Dict = dict()
+        max_workers = max(1, min(worker_num, len(groups)))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='get_many_by_keys') as executor:
+            futures: Dict[Future, List] = dict()
+            for part_id, part_values in groups.items():
+                dao = self.mysql_dao_list[part_id]
+                futures[executor.submit(dao.get_many_by_keys, key, part_values)] = part_values
+            for future, part_values in futures.items():
+                found.update(zip(part_values, future.result()))
+        return [found[v] for v in values]
+
+    def get_many_by_ids(self, ids: List[PKType], worker_num: int = 4) -> List[Optional[EntityType]]:
+        return self.get_many_by_keys('id', ids, worker_num=worker_num)
+
+    # 按分表键分组后各分表并行批量写入(见MySQLDao.save_many)，返回与entities一一对应的结果
+    # 写入速度由各分表Dao自身的写入限速控制(max_write_per_second等)，互不影响
+    # 某个分表失败不影响其他分表：失败分表的结果为False，异常记录到failures(part_id -> 异常)；failures为None时最后raise RuntimeError
+    def save_many(
+            self,
+            entities: List[EntityType],
+            mode='ignore',
+            ignore_create_update_time=True,
+            worker_num: int = 4,
+            failures: Dict[int, Exception] = None,
+    ) -> List[bool]:
+        groups: Dict[int, List[int]] = dict()
+        for i, o in enumerate(entities):
+            v = o.get(self.sharding_key) if isinstance(o, dict) else getattr(o, self.sharding_key, None)
+            if v is None:
+                msg = f'{self.sharding_key} not set {o}'
+                raise RuntimeError(msg)
+            groups.setdefault(self.do_sharding(v), []).append(i)
+        results = [False] * len(entities)
+        errors: Dict[int, Exception] = dict()
+        max_workers = max(1, min(worker_num, len(groups)))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sharding_save') as executor:
+            futures: Dict[Future, int] = dict()
+            for part_id, indexes in groups.items():
+                dao = self.mysql_dao_list[part_id]
+                part = [entities[i] for i in indexes]
+                futures[executor.submit(dao.save_many, part, mode, ignore_create_update_time)] = part_id
+            for future, part_id in futures.items():
+                try:
+                    part_results = future.result()
+                except Exception as e:
+                    logger.warning(f'save_many part={part_id} {self.mysql_dao_list[part_id].db_tb_name} e={e}')
+                    errors[part_id] = e
+                    continue
+                for i, ret in zip(groups[part_id], part_results):
+                    results[i] = ret
+        if failures is not None:
+            failures.update(errors)
+        elif errors:
+            msg = f'save_many failed parts={sorted(errors)}'
+            raise RuntimeError(msg) from next(iter(errors.values()))
+        return results
+
+    # 不指定分表键的查询：在所有分表上并行执行get，返回任一分表的结果
+    # timeout/failures 见scatter_get_many
+    def scatter_get(
+            self,
+            timeout: float = None,
+            failures: Dict[int, Exception] = None,
+            **kwargs,
+    ) -> Optional[EntityType]:
+        for item in self.scatter_get_many(limit=1, timeout=timeout, failures=failures, **kwargs):
+            return item
+        return None
+
+    # 不指定分表键的查询：在所有分表上并行执行get_many(参数含义相同)，各分表每读取batch_size条即返回，不等待其他分表
+    # order_by不为空时各分表分别排序，全部完成后k路归并为全局有序，limit为全局条数(每个分表最多取limit条)
+    # timeout为整个调用的超时秒数，包括排队等待线程的时间，不包括调用方处理返回数据的时间
+    # 失败或超时的分表记录到failures(part_id -> 异常)并返回其余分表的结果(无序时该分表已经返回的数据不撤回)
+    # failures为None时任一分表失败则raise RuntimeError
+    # kwargs包含分表键时只查询对应分表
+    def scatter_get_many(
+            self,
+            limit=None,
+            order_by: Optional[str] = None,
+            desc: bool = False,
+            timeout: float = None,
+            failures: Dict[int, Exception] = None,
+            **kwargs,
+    ) -> Generator[EntityType, None, None]:
+        if not order_by:
+            def _get_many_iter(dao: MySQLDao) -> Iterable[List[EntityType]]:
+                return split_iter(dao.get_many(limit=limit, **kwargs), dao.batch_size)
+
+            chunks = self._scatter_stream(_get_many_iter, timeout=timeout, failures=failures, sharding_kwargs=kwargs)
+            try:
+                yield from islice((item for _, items in chunks for item in items), limit)
+            finally:
+                chunks.close()
+            return
+
+        def _get_many(dao: MySQLDao) -> List[EntityType]:
+            return list(dao.get_many(limit=limit, order_by=order_by, desc=desc, **kwargs))
+
+        results = self._scatter(_get_many, timeout=timeout, failures=failures, sharding_kwargs=kwargs)
+
+        def _sort_key(o):
+            v = o[order_by] if isinstance(o, dict) else getattr(o, order_by)
+            return v is not None, v  # 与MySQL一致 NULL最小
+
+        merged = heapq.merge(*(items for _, items in results), key=_sort_key, reverse=desc)
+        yield from islice(merged, limit)
+
+    def _get_scatter_executor(self) -> ThreadPoolExecutor:
+        with self._scatter_executor_lock:
+            if self._scatter_executor is None:
+                self._scatter_executor = ThreadPoolExecutor(
+                    max_workers=self.scatter_worker_num, thread_name_prefix='scatter')
+            return self._scatter_executor
+
+    def _scatter_part_ids(self, sharding_kwargs: Optional[Dict]) -> List[int]:
+        if sharding_kwargs and self.sharding_key in sharding_kwargs:
+            return [self.do_sharding(sharding_kwargs[self.sharding_key])]
+        return list(range(len(self.mysql_dao_list)))
+
+    # 在各分表上并行执行func(dao)，按完成顺序返回 (part_id, 结果)
+    # 超时从调用开始计算，排队等待线程的时间也计入；超时的查询无法中断，结果被丢弃
+    def _scatter(
+            self,
+            func: Callable[[MySQLDao], Any],
+            timeout: float = None,
+            failures: Dict[int, Exception] = None,
+            sharding_kwargs: Dict = None,
+    ) -> Generator[Tuple[int, Any], None, None]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        executor = self._get_scatter_executor()
+        futures: Dict[Future, int] = {
+            executor.submit(func, self.mysql_dao_list[part_id]): part_id
+            for part_id in self._scatter_part_ids(sharding_kwargs)
+        }
+        pending = set(futures)
+        try:
+            while pending:
+                wait_secs = None if deadline is None else max(0.0, deadline - time.monotonic())
+                done, _ = wait(pending, timeout=wait_secs, return_when=FIRST_COMPLETED)
+                if not done:
+                    for future in list(pending):
+                        pending.remove(future)
+                        self._scatter_fail(futures[future], TimeoutError(f'timeout {timeout}s'), failures)
+                    break
+                for future in done:
+                    pending.remove(future)
+                    part_id = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self._scatter_fail(part_id, e, failures)
+                        continue
+                    t = time.monotonic()
+                    yield part_id, result
+                    if deadline is not None:
+                        deadline += time.monotonic() - t
+        finally:
+            for future in pending:
+                future.cancel()
+
+    # 与_scatter相同，func(dao)返回分批的结果，每批就绪即返回 (part_id, 一批结果)，不需要等待分表全部读取完成
+    # 各分表通过有界队列交给调用方，调用方处理慢时分表的读取随之暂停；调用方提前退出时分表停止读取
+    def _scatter_stream(
+            self,
+            func: Callable[[MySQLDao], Iterable[List]],
+            timeout: float = None,
+            failures: Dict[int, Exception] = None,
+            sharding_kwargs: Dict = None,
+    ) -> Generator[Tuple[int, List], None, None]:
+        part_ids = self._scatter_part_ids(sharding_kwargs)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        results: queue.Queue = queue.Queue(maxsize=2 * len(part_ids))  # (part_id, 一批结果, 异常) 一批结果为None表示完成
+        stop = threading.Event()
+
+        def _put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def _run(part_id):
+            try:
+                for chunk in func(self.mysql_dao_list[part_id]):
+                    if not _put((part_id, chunk, None)):
+                        return
+                _put((part_id, None, None))
+            except Exception as e:
+                _put((part_id, None, e))
+
+        executor = self._get_scatter_executor()
+        futures = [executor.submit(_run, part_id) for part_id in part_ids]
+        remaining = set(part_ids)
+        try:
+            while remaining:
+                wait_secs = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    part_id, chunk, error = results.get(timeout=wait_secs)
+                except queue.Empty:
+                    for part_id in sorted(remaining):
+                        remaining.remove(part_id)
+                        self._scatter_fail(part_id, TimeoutError(f'timeout {timeout}s'), failures)
+                    break
+                if part_id not in remaining:
+                    continue
+                if error is not None:
+                    remaining.remove(part_id)
+                    self._scatter_fail(part_id, error, failures)
+                elif chunk is None:
+                    remaining.remove(part_id)
+                else:
+                    t = time.monotonic()
+                    yield part_id, chunk
+                    if deadline is not None:
+                        deadline += time.monotonic() - t
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+
+    def _scatter_fail(self, part_id: int, e: Exception, failures: Optional[Dict[int, Exception]]):
+        logger.warning(f'scatter part={part_id} {self.mysql_dao_list[part_id].db_tb_name} e={e}')
+        if failures is None:
+            msg = f'scatter part={part_id} failed: {e}'
+            raise RuntimeError(msg) from e
+        failures[part_id] = e
+
     # 读取分库分表数据，并批量返回
+    # 始终保持至多worker_num个分表在读取，优先读取偏移量最小的分表；阻塞等待任一读取完成，不空转
+    # 读取为空的分表：infinite_wait_secs为0时不再读取，全部为空后退出；否则等待infinite_wait_secs后重新读取
+    # 偏移量每批读取完成后写入offsets_cache，空闲分表的偏移量调度前从offsets_cache重新加载(允许外部修改)
+    # ordered=True 时按scan_key全局有序返回，见_ordered_scan
+    # lease不为空时多进程协作读取，见_cooperative_scan
     def sharding_scan(
             self,
             offsets_cache: RedisHash,  # 偏移量存储在redis
@@ -61,63 +316,242 @@ class MySQLShardingDao(object):
             infinite_wait_secs: int = 0,  # 0表示取完数立即退出，否则等待
             worker_num: int = 1,  # 读取MySQL线程数
             part_num: int = None,  # 只读取前part个分表
+            ordered: bool = False,  # 全局有序 要求infinite_wait_secs为0且scan_key为单列
+            lease: Optional[RedisLease] = None,  # 多进程协作时分表的租约
     ) -> Generator[List[EntityType], None, None]:
         scan_key = scan_key or self.sharding_key
+        if lease is not None:
+            if ordered:
+                msg = 'ordered sharding_scan does not support lease'
+                raise RuntimeError(msg)
+            part_num = part_num or len(self.mysql_dao_list)
+            yield from self._cooperative_scan(
+                offsets_cache, lease, start, scan_key, infinite_wait_secs, worker_num, part_num)
+            return
+        if ordered and (infinite_wait_secs != 0 or not isinstance(scan_key, str)):
+            msg = f'ordered sharding_scan requires infinite_wait_secs=0 and single scan_key, got {scan_key}'
+            raise RuntimeError(msg)
         part_num = part_num or len(self.mysql_dao_list)
+        cache_keys = [f'{part_id:03d}' for part_id in range(part_num)]
+
+        # check whether write start to cache.
+        offsets: List[PKType] = offsets_cache.get_many(cache_keys)
+        missing = {cache_keys[part_id]: start for part_id, offset in enumerate(offsets) if offset is None}
+        if missing:
+            assert start is not None
+            offsets_cache.set_many(missing)
+            offsets = [start if offset is None else offset for offset in offsets]
+        if ordered:
+            yield from self._ordered_scan(offsets_cache, offsets, scan_key, worker_num)
+            return
 
+        empty_since: Dict[int, float] = dict()  # 上次读取为空的分表 -> 时间
+        running: Dict[Future, Tuple[int, PKType]] = dict()  # future -> (part_id, offset)
         with ThreadPoolExecutor(max_workers=worker_num, thread_name_prefix='sharding_scan') as executor:
-            # check whether write start to cache.
-            for part_id in range(part_num):
-                if offsets_cache.get(f'{part_id:03d}') is None:
-                    assert start is not None
-                    offsets_cache.set(f'{part_id:03d}', start)
+            while True:
+                # start new jobs.
+                now, wait_secs = time.monotonic(), None
+                running_parts = set(part_id for part_id, _ in running.values())
+                idle = []
+                for part_id in range(part_num):
+                    if part_id in running_parts:
+                        continue
+                    if part_id in empty_since:
+                        if infinite_wait_secs == 0:
+                            continue
+                        remain = empty_since[part_id] + infinite_wait_secs - now
+                        if remain > 0:
+                            wait_secs = remain if wait_secs is None else min(wait_secs, remain)
+                            continue
+                    idle.append(part_id)
+                if idle and len(running) < worker_num:
+                    # load offsets from redis
+                    for part_id, offset in zip(idle, offsets_cache.get_many([cache_keys[i] for i in idle])):
+                        if offset is not None and offset != offsets[part_id]:
+                            logger.info(f'reload offset {part_id} {offsets[part_id]} -> {offset}')
+                            offsets[part_id] = offset
+                            empty_since.pop(part_id, None)
+                    idle.sort(key=lambda i: offsets[i])
+                    for part_id in idle[:worker_num - len(running)]:
+                        dao = self.mysql_dao_list[part_id]
+                        future = executor.submit(dao.scan_iter, offsets[part_id], scan_key, dao.batch_size)
+                        running[future] = (part_id, offsets[part_id])
+                if not running:
+                    if wait_secs is None:
+                        break
+                    time.sleep(wait_secs)
+                    continue
+
+                # wait for any job done.
+                done, _ = wait(running, timeout=wait_secs, return_when=FIRST_COMPLETED)
+                updates = dict()
+                for future in done:
+                    part_id, last_offset = running.pop(future)
+                    next_offset, items = future.result()
+                    logger.info(f'{part_id} {last_offset}->{next_offset} count={len(items)}')
+                    yield items
+                    offsets[part_id] = next_offset
+                    updates[cache_keys[part_id]] = next_offset
+                    if next_offset == last_offset:
+                        empty_since[part_id] = time.monotonic()
+                    else:
+                        empty_since.pop(part_id, None)
+                offsets_cache.set_many(updates)
+
+    # 各分表按scan_key有序读取，用堆k路归并，按batch_size分批返回全局有序的数据
+    # 每个分表最多缓存一批数据，并在后台提前读取下一批，内存占用与分表数*batch_size成正比
+    # offsets_cache记录每个分表「已完整返回」的最后一个scan_key值(同值的数据全部返回后才推进)，在每批数据被消费后写入
+    def _ordered_scan(
+            self,
+            offsets_cache: RedisHash,
+            offsets: List[PKType],
+            scan_key: str,
+            worker_num: int,
+    ) -> Generator[List[EntityType], None, None]:
+        def _key(o):
+            return o[scan_key] if isinstance(o, dict) else getattr(o, scan_key)
+
+        part_num = len(offsets)
+        buffers: List[deque] = [deque() for _ in range(part_num)]
+        futures: List[Optional[Future]] = [None] * part_num
+        done_keys: Dict[int, PKType] = dict()  # 分表 -> 已完整返回的scan_key值 未写入offsets_cache的部分
+        batch_size = self.mysql_dao_list[0].batch_size
+
+        with ThreadPoolExecutor(max_workers=worker_num, thread_name_prefix='ordered_scan') as executor:
+            def _fetch(part_id, offset):
+                dao = self.mysql_dao_list[part_id]
+                futures[part_id] = executor.submit(dao.scan_iter, offset, scan_key, dao.batch_size)
+
+            # 当前批用完时取下一批，并提前读取再下一批，返回是否还有数据
+            def _refill(part_id) -> bool:
+                next_offset, items = futures[part_id].result()
+                futures[part_id] = None
+                logger.info(f'{part_id} {offsets[part_id]}->{next_offset} count={len(items)}')
+                if next_offset == offsets[part_id]:
+                    return False
+                offsets[part_id] = next_offset
+                buffers[part_id].extend(items)
+                _fetch(part_id, next_offset)
+                return len(buffers[part_id]) > 0 or _refill(part_id)
 
-            # initialize the future_info
-            futures: List[Tuple[Optional[Future], PKType, bool]] = []  # (future, last_offset, last_scan_empty)
             for part_id in range(part_num):
-                futures.append((None, offsets_cache.get(f'{part_id:03d}'), False))
+                _fetch(part_id, offsets[part_id])
+            heap = []
+            for part_id in range(part_num):
+                if _refill(part_id):
+                    heap.append((_key(buffers[part_id][0]), part_id))
+            heapq.heapify(heap)
+
+            batch = []
+            while heap:
+                key, part_id = heap[0]
+                batch.append(buffers[part_id].popleft())
+                if not buffers[part_id] and not _refill(part_id):
+                    heapq.heappop(heap)
+                    done_keys[part_id] = key
+                else:
+                    next_key = _key(buffers[part_id][0])
+                    if next_key != key:
+                        done_keys[part_id] = key
+                    heapq.heapreplace(heap, (next_key, part_id))
+                if len(batch) >= batch_size or not heap:
+                    checkpoint = {f'{i:03d}': v for i, v in done_keys.items()}
+                    done_keys.clear()
+                    yield batch
+                    offsets_cache.set_many(checkpoint)
+                    batch = []
+
+    # 多进程/多机协作读取：每个进程通过lease抢占至多worker_num个分表，持有期间后台续约
+    # 持有者死亡(租约过期)的分表由其他进程接管，从offsets_cache中的进度继续，可能重复返回最后一批数据
+    # 偏移量仅在仍持有租约时写入(lua比较后写入)，失去租约的分表丢弃正在读取的数据
+    # 每批返回前续约(lua比较后续约)，续约失败说明已被抢占，丢弃该批
+    # 每次抢占分表时递增其generation，读取结果与当前generation不一致(失去后又重新抢占)时丢弃，不覆盖新的偏移量
+    # infinite_wait_secs为0时读取为空的分表记为已完成(lease.done)，全部分表完成后退出
+    # done集合默认一直保留，同一lease.name重新扫描前需lease.reset_done()，或创建lease时设置done_ttl
+    def _cooperative_scan(
+            self,
+            offsets_cache: RedisHash,
+            lease: RedisLease,
+            start,
+            scan_key,
+            infinite_wait_secs: int,
+            worker_num: int,
+            part_num: int,
+    ) -> Generator[List[EntityType], None, None]:
+        cache_keys = [f'{part_id:03d}' for part_id in range(part_num)]  # 同时作为lease的资源名
+        part_ids = {key: part_id for part_id, key in enumerate(cache_keys)}
+        offsets: Dict[int, PKType] = dict()  # 持有的分表 -> 偏移量
+        empty_since: Dict[int, float] = dict()
+        generations: Dict[int, int] = dict()  # 分表 -> 抢占次数
+        running: Dict[Future, Tuple[int, PKType, int]] = dict()  # future -> (分表, 偏移量, generation)
+        retry_secs = lease.ttl / 3  # 等待其他进程释放或租约过期的检查间隔
 
+        with lease, ThreadPoolExecutor(max_workers=worker_num, thread_name_prefix='cooperative_scan') as executor:
             while True:
-                sleep_for_next_round = True
-
-                # check whether to start a new job.
-                part_id, offset, all_last_scan_empty = None, None, True
-                for part_id_t in range(part_num):
-                    future, offset_t, last_scan_empty = futures[part_id_t]
-                    if future:
-                        all_last_scan_empty = False
-                    else:
-                        # load offset_t from redis
-                        offset_t_cache = offsets_cache.get(f'{part_id_t:03d}')
-                        if offset_t_cache != offset_t:
-                            logger.info(f'reload offset {part_id} {offset_t} -> {offset_t_cache}')
-                            offset_t = offset_t_cache
-
-                        if not last_scan_empty:
-                            all_last_scan_empty = False
-                        if (infinite_wait_secs == 0 or not last_scan_empty) and (offset is None or offset_t < offset):
-                            part_id, offset = part_id_t, offset_t
-                if all_last_scan_empty and infinite_wait_secs == 0:
-                    break
+                # drop lost partitions and claim new ones.
+                held = set(part_ids[key] for key in lease.held() if key in part_ids)
+                for part_id in [part_id for part_id in offsets if part_id not in held]:
+                    logger.warning(f'lease lost {part_id} offset={offsets[part_id]}')
+                    offsets.pop(part_id)
+                    empty_since.pop(part_id, None)
+                if len(held) < worker_num:
+                    done = set(part_ids[key] for key in lease.done() if key in part_ids)
+                    if infinite_wait_secs == 0 and len(done) == part_num and not running:
+                        break
+                    for part_id in range(part_num):
+                        if len(held) >= worker_num:
+                            break
+                        if part_id not in held and part_id not in done and lease.acquire(cache_keys[part_id]):
+                            held.add(part_id)
+                new_parts = [part_id for part_id in held if part_id not in offsets]
+                for part_id, offset in zip(new_parts, offsets_cache.get_many([cache_keys[i] for i in new_parts])):
+                    if offset is None:
+                        assert start is not None
+                        offset = start
+                        lease.hset_if_owner(cache_keys[part_id], offsets_cache, cache_keys[part_id], offset)
+                    logger.info(f'lease claimed {part_id} offset={offset}')
+                    offsets[part_id] = offset
+                    generations[part_id] = generations.get(part_id, 0) + 1
+
+                # start new jobs.
+                now, wait_secs = time.monotonic(), retry_secs
+                running_parts = set(part_id for part_id, _, _ in running.values())
+                for part_id, offset in offsets.items():
+                    if part_id in running_parts:
+                        continue
+                    if part_id in empty_since:
+                        remain = empty_since[part_id] + infinite_wait_secs - now
+                        if remain > 0:
+                            wait_secs = min(wait_secs, remain)
+                            continue
+                    dao = self.mysql_dao_list[part_id]
+                    future = executor.submit(dao.scan_iter, offset, scan_key, dao.batch_size)
+                    running[future] = (part_id, offset, generations[part_id])
+                if not running:
+                    time.sleep(wait_secs)
+                    continue
 
-                # start a new job.
-                if offset is not None:
-                    sleep_for_next_round = False
-                    count = self.mysql_dao_list[part_id].batch_size
-                    future_next = executor.submit(self.mysql_dao_list[part_id].scan_iter, offset, scan_key, count)
-                    futures[part_id] = (future_next, offset, last_scan_empty)
-                    # logger.info(f'start a new job {part_id}')
-
-                # check if any future done.
-                for part_id_t, (future, last_offset, last_scan_empty) in enumerate(futures):
-                    if future and future.done():
-                        sleep_for_next_round = False
-                        next_offset, items = future.result()
-                        logger.info(f'{part_id_t} {last_offset}->{next_offset} count={len(items)}')
-                        yield items
-                        offsets_cache.set(f'{part_id_t:03d}', next_offset)
-                        futures[part_id_t] = (None, next_offset, next_offset == last_offset)
-
-                if sleep_for_next_round:
-                    # logger.info('nothing changed, sleep_for_next_round.')
-                    time.sleep(1.0)
+                # wait for any job done.
+                done_futures, _ = wait(running, timeout=wait_secs, return_when=FIRST_COMPLETED)
+                for future in done_futures:
+                    part_id, last_offset, generation = running.pop(future)
+                    next_offset, items = future.result()
+                    if part_id not in offsets or generation != generations[part_id]:
+                        logger.warning(f'drop stale {part_id} {last_offset}->{next_offset} count={len(items)}')
+                        continue
+                    if not lease.renew(cache_keys[part_id]):
+                        offsets.pop(part_id)
+                        empty_since.pop(part_id, None)
+                        continue
+                    logger.info(f'{part_id} {last_offset}->{next_offset} count={len(items)}')
+                    yield items
+                    if next_offset == last_offset:
+                        if infinite_wait_secs == 0:
+                            lease.release(cache_keys[part_id], done=True)
+                            offsets.pop(part_id)
+                            continue
+                        empty_since[part_id] = time.monotonic()
+                    else:
+                        empty_since.pop(part_id, None)
+                    if lease.hset_if_owner(cache_keys[part_id], offsets_cache, cache_keys[part_id], next_offset):
+                        offsets[part_id] = next_offset
@@ -0,0 +1,124 @@
+# encoding=utf8
+
+import sys
+import time
+import logging
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Iterable, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# 估算对象占用的内存 只展开一层dict/list/pydantic model 用于max_bytes限制
+def _sizeof(o) -> int:
+    if hasattr(o, '__dict__') and not isinstance(o, type):
+        o = o.__dict__
+    size = sys.getsizeof(o)
+    if isinstance(o, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in o.items())
+    elif isinstance(o, (list, tuple)):
+        size += sum(sys.getsizeof(v) for v in o)
+    return size
+
+
+# 线程安全的LRU缓存，带TTL，按条目数和估算的内存大小限制，可以缓存None(负缓存)
+# tags用于按标签批量失效，如 ('id', 1) 失效所有包含id=1实体的条目
+# version在每次失效时递增，用于避免「读库 -> 写库并失效 -> 写入旧值」的并发问题，见set(version=)
+class TTLCache(object):
+    def __init__(
+            self,
+            max_entries: int = 10000,
+            ttl: float = 60.0,
+            negative_ttl: float = None,  # None值的TTL 默认同ttl
+            max_bytes: int = 0,  # 0为不限制
+    ):
+        self.max_entries: int = max_entries
+        self.ttl: float = ttl
+        self.negative_ttl: float = ttl if negative_ttl is None else negative_ttl
+        self.max_bytes: int = max_bytes
+        self._data: OrderedDict[Hashable, Tuple[Any, float, int, Tuple]] = OrderedDict()  # (value, expire, size, tags)
+        self._tags: Dict[Hashable, Set[Hashable]] = dict()
+        self._bytes: int = 0
+        self._version: int = 0
+        self._lock = Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    # 返回 (是否命中, value)
+    def get(self, key) -> Tuple[bool, Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] < time.monotonic():
+                if item is not None:
+                    self._remove(key)
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, item[0]
+
+    # version不为None且期间发生过失效时不写入
+    def set(self, key, value, tags: Iterable[Hashable] = (), version: int = None):
+        size = _sizeof(value) if self.max_bytes > 0 else 0
+        ttl = self.ttl if value is not None else self.negative_ttl
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            if key in self._data:
+                self._remove(key)
+            tags = tuple(tags)
+            self._data[key] = (value, time.monotonic() + ttl, size, tags)
+            self._bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.max_entries or (self.max_bytes > 0 and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self, key):
+        with self._lock:
+            self._version += 1
+            if key in self._data:
+                self._remove(key)
+
+    def invalidate_tag(self, tag):
+        with self._lock:
+            self._version += 1
+            for key in self._tags.pop(tag, ()):
+                if key in self._data:
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._data.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, _, size, tags = self._data.pop(key)
+        self._bytes -= size
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    self._tags.pop(tag)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def __len__(self):
+        return len(self._data)
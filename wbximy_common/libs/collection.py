@@ -1,8 +1,8 @@
 # encoding=utf8
 
 import logging
-from typing import List, Generator, Dict
-from itertools import groupby
+from typing import List, Generator, Dict, Iterable, AsyncIterable, AsyncGenerator
+from itertools import groupby, islice
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +13,28 @@ def split_parts(lst: List, sz: int) -> Generator[List, None, None]:
         yield lst[i: min(i+sz, len(lst))]
 
 
+# 迭代器分段 按需读取
+def split_iter(iterable: Iterable, sz: int) -> Generator[List, None, None]:
+    it = iter(iterable)
+    while True:
+        part = list(islice(it, sz))
+        if not part:
+            return
+        yield part
+
+
+# split_iter的async版本
+async def asplit_iter(aiterable: AsyncIterable, sz: int) -> AsyncGenerator[List, None]:
+    part = []
+    async for x in aiterable:
+        part.append(x)
+        if len(part) >= sz:
+            yield part
+            part = []
+    if part:
+        yield part
+
+
 def update_dict_value(d: Dict, k, old, new, force=False):
     if (force and k not in d) or (k in d and d[k] == old):
         d[k] = new
@@ -2,9 +2,13 @@
 
 import logging
 from concurrent.futures import ThreadPoolExecutor
-from threading import BoundedSemaphore
+from queue import Queue, Full
+from threading import BoundedSemaphore, Event, Thread
+from typing import Iterable, Generator, TypeVar
 
 logger = logging.getLogger(__name__)
+T = TypeVar('T')
+_PREFETCH_END = object()
 
 
 # https://gist.github.com/frankcleary/f97fe244ef54cd75278e521ea52a697a
@@ -26,3 +30,40 @@ class BoundedExecutor(ThreadPoolExecutor):
         else:
             future.add_done_callback(lambda x: self.semaphore.release())
             return future
+
+
+# 在后台线程中提前读取iterable的后续元素，最多缓存depth个，使数据读取与消费重叠
+# 后台线程的异常在消费方重新抛出；消费方提前退出(break/close)时后台线程在当前元素读取完成后停止
+def prefetch(iterable: Iterable[T], depth: int = 1, name: str = 'prefetch') -> Generator[T, None, None]:
+    queue = Queue(maxsize=depth)
+    stop = Event()
+
+    def _put(o) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(o, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put((item, None)):
+                    return
+            _put((_PREFETCH_END, None))
+        except BaseException as e:
+            _put((_PREFETCH_END, e))
+
+    Thread(target=_produce, name=name, daemon=True).start()
+    try:
+        while True:
+            item, e = queue.get()
+            if item is _PREFETCH_END:
+                if e is not None:
+                    raise e
+                return
+            yield item
+    finally:
+        stop.set()
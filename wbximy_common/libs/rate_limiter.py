@@ -0,0 +1,66 @@
+# encoding=utf8
+
+import time
+import logging
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+# 令牌桶限速 线程安全
+# rate: 每秒生成的令牌数  burst: 桶容量，即允许的瞬时突发量
+# 允许透支：acquire(n)超过桶内令牌时，等待补齐透支的部分，多个线程按预定顺序依次等待，速度平滑地收敛到rate
+class TokenBucket(object):
+    def __init__(self, rate: float, burst: float = None):
+        assert rate > 0
+        self.rate: float = rate
+        self.burst: float = burst or max(rate, 1.0)
+        self._tokens: float = self.burst
+        self._last_time: float = time.monotonic()
+        self._lock = Lock()
+
+    # 预定n个令牌，返回需要等待的秒数
+    def reserve(self, n: float = 1) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_time) * self.rate)
+            self._last_time = now
+            self._tokens -= n
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    # 阻塞直到获得n个令牌，返回等待的秒数
+    def acquire(self, n: float = 1) -> float:
+        wait = self.reserve(n)
+        if wait > 0:
+            logger.debug('token bucket rate=%s wait %.3f for %s', self.rate, wait, n)
+            time.sleep(wait)
+        return wait
+
+
+# 多进程/多机共享的令牌桶，状态存放在redis hash中，由lua脚本原子地完成预定，时间以redis服务端为准
+class RedisTokenBucket(TokenBucket):
+    _RESERVE_SCRIPT = '''
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local n = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local v = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(v[1]) or burst
+local ts = tonumber(v[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate) - n
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((burst - tokens) / rate) + 1)
+if tokens >= 0 then
+    return '0'
+end
+return tostring(-tokens / rate)
+'''
+
+    def __init__(self, redis, name: str, rate: float, burst: float = None):
+        super().__init__(rate=rate, burst=burst)
+        self.name: str = name
+        self._reserve_script = redis.register_script(self._RESERVE_SCRIPT)
+
+    def reserve(self, n: float = 1) -> float:
+        return float(self._reserve_script(keys=[self.name], args=[self.rate, self.burst, n]))